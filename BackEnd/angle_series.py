@@ -0,0 +1,184 @@
+import os
+import time
+import zlib
+from typing import Optional
+import numpy as np
+from bson import Binary, ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query
+from database import db
+from live_workouts import BatchWriter
+from auth import get_current_user
+
+# Angles are kept as min/max per ANGLE_BUCKET_MS bucket and stored in chunks
+# covering ANGLE_CHUNK_BUCKETS buckets (60 s by default), one zlib-compressed
+# binary column per series.
+ANGLE_BUCKET_MS = int(os.getenv("ANGLE_BUCKET_MS", "100"))
+ANGLE_CHUNK_BUCKETS = int(os.getenv("ANGLE_CHUNK_BUCKETS", "600"))
+
+ANGLE_COLUMNS = ("hip_min", "hip_max", "knee_min", "knee_max", "ankle_min", "ankle_max")
+
+angle_series_collection = db.get_collection("angle_series")
+angle_chunk_writer = BatchWriter(angle_series_collection, batch_size=50)
+
+angle_series_router = APIRouter()
+
+
+def encode_column(values):
+    return Binary(zlib.compress(np.ascontiguousarray(values).tobytes()))
+
+
+def decode_column(data, dtype):
+    return np.frombuffer(zlib.decompress(data), dtype=dtype)
+
+
+class AngleSeriesRecorder:
+    """Downsamples one session's hip/knee/ankle vertical angles into
+    preallocated per-chunk buffers and hands full chunks to the writer."""
+
+    def __init__(self, session_id, user_id, writer=angle_chunk_writer,
+                 bucket_ms=ANGLE_BUCKET_MS, chunk_buckets=ANGLE_CHUNK_BUCKETS):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.writer = writer
+        self.bucket_ms = bucket_ms
+        self.chunk_buckets = chunk_buckets
+
+        # Bucket index (relative to chunk_start) and min/max columns of filled buckets.
+        self.offsets = np.zeros(chunk_buckets, dtype=np.uint16)
+        self.values = np.zeros((chunk_buckets, len(ANGLE_COLUMNS)), dtype=np.int16)
+        self.count = 0
+
+        self.chunk_start = None  # Epoch ms
+        self.bucket = None
+        self.current = None      # Min/max of the open bucket, ANGLE_COLUMNS order
+
+    def _commit_bucket(self):
+        if self.current is None:
+            return
+        self.offsets[self.count] = self.bucket
+        self.values[self.count] = self.current
+        self.count += 1
+        self.current = None
+
+    def _emit_chunk(self):
+        if self.count == 0:
+            return
+
+        n = self.count
+        doc = {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "start": self.chunk_start,
+            "end": self.chunk_start + (int(self.offsets[n - 1]) + 1) * self.bucket_ms,
+            "bucket_ms": self.bucket_ms,
+            "n": n,
+            "t": encode_column(self.offsets[:n]),
+        }
+        for i, column in enumerate(ANGLE_COLUMNS):
+            doc[column] = encode_column(self.values[:n, i])
+
+        self.writer.add_documents([doc])
+        self.count = 0
+
+    def add(self, angles, now_ms=None):
+        if angles is None:
+            return
+
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        if self.chunk_start is None:
+            self.chunk_start = now_ms
+
+        bucket = (now_ms - self.chunk_start) // self.bucket_ms
+        hip, knee, ankle = angles
+
+        if bucket == self.bucket and self.current is not None:
+            current = self.current
+            current[0] = min(current[0], hip)
+            current[1] = max(current[1], hip)
+            current[2] = min(current[2], knee)
+            current[3] = max(current[3], knee)
+            current[4] = min(current[4], ankle)
+            current[5] = max(current[5], ankle)
+            return
+
+        self._commit_bucket()
+        if bucket >= self.chunk_buckets:
+            self._emit_chunk()
+            self.chunk_start = now_ms
+            bucket = 0
+
+        self.bucket = bucket
+        self.current = [hip, hip, knee, knee, ankle, ankle]
+
+    def flush(self):
+        self._commit_bucket()
+        self._emit_chunk()
+        self.chunk_start = None
+        self.bucket = None
+
+
+async def ensure_indexes():
+    await angle_series_collection.create_index([("session_id", 1), ("start", 1)])
+
+
+def decimate(t, columns, points):
+
+    # Min/max decimation keeps the peaks of each series at any resolution.
+    factor = max(1, -(-len(t) // points))
+    if factor == 1:
+        return t, columns, factor
+
+    starts = np.arange(0, len(t), factor)
+    reduced = {}
+    for name, values in columns.items():
+        reduce = np.minimum if name.endswith("_min") else np.maximum
+        reduced[name] = reduce.reduceat(values, starts)
+
+    return t[starts], reduced, factor
+
+
+@angle_series_router.get("/sessions/{session_id}/angles")
+async def get_angle_series(
+    session_id: str,
+    start: Optional[int] = Query(None, description="Epoch ms"),
+    end: Optional[int] = Query(None, description="Epoch ms"),
+    points: int = Query(500, ge=10, le=5000),
+    user_id: str = Depends(get_current_user),
+):
+    query = {"session_id": session_id, "user_id": ObjectId(user_id)}
+    if start is not None:
+        query["end"] = {"$gt": start}
+    if end is not None:
+        query["start"] = {"$lte": end}
+
+    chunks = await angle_series_collection.find(query, {"_id": 0, "session_id": 0, "user_id": 0}) \
+        .sort("start", 1).to_list(length=None)
+    if not chunks:
+        raise HTTPException(status_code=404, detail="No angle data for this session and range")
+
+    bucket_ms = chunks[0]["bucket_ms"]
+    t = np.concatenate([
+        chunk["start"] + decode_column(chunk["t"], np.uint16).astype(np.int64) * chunk["bucket_ms"]
+        for chunk in chunks
+    ])
+    columns = {
+        column: np.concatenate([decode_column(chunk[column], np.int16) for chunk in chunks])
+        for column in ANGLE_COLUMNS
+    }
+
+    mask = np.ones(len(t), dtype=bool)
+    if start is not None:
+        mask &= t >= start
+    if end is not None:
+        mask &= t <= end
+    t = t[mask]
+    columns = {name: values[mask] for name, values in columns.items()}
+
+    t, columns, factor = decimate(t, columns, points)
+
+    return {
+        "session_id": session_id,
+        "bucket_ms": bucket_ms * factor,
+        "t": t.tolist(),
+        **{name: values.tolist() for name, values in columns.items()},
+    }
@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+import jwt as pyjwt
+from bson import ObjectId
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from dotenv import load_dotenv
+from database import users_collection
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JWT_SECRET = os.getenv("JWT_SECRET")
+ALGORITHM = "HS256"
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+# Verified tokens and known-to-exist users are cached so per-request auth is a
+# dict hit instead of an HMAC verify (and, for existence checks, a DB read).
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+USER_EXISTS_TTL = float(os.getenv("USER_EXISTS_TTL", "300"))
+
+
+class TTLCache:
+    """Small LRU cache whose entries carry their own expiry (epoch seconds)."""
+
+    def __init__(self, maxsize=AUTH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+_verified_tokens = TTLCache()
+_existing_users = TTLCache()
+
+
+def _credentials_exception(detail="Could not validate credentials"):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def verify_token(token: str) -> str:
+    """Return the user_id of a valid JWT, raising 401 otherwise."""
+    user_id = _verified_tokens.get(token)
+    if user_id is not None:
+        return user_id
+
+    try:
+        payload = pyjwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+    except pyjwt.ExpiredSignatureError:
+        logger.error("Token has expired")
+        raise _credentials_exception("Token has expired")
+    except pyjwt.PyJWTError as e:
+        logger.error(f"JWT error: {str(e)}")
+        raise _credentials_exception()
+
+    user_id = payload.get("user_id")
+    if user_id is None or not ObjectId.is_valid(user_id):
+        raise _credentials_exception()
+
+    # Never cache a token past its own expiry.
+    _verified_tokens.put(token, user_id, payload.get("exp", time.time() + USER_EXISTS_TTL))
+    return user_id
+
+
+def user_id_from_token(token: Optional[str]) -> Optional[str]:
+    """Like verify_token, but returns None for a missing or invalid token."""
+    if not token:
+        return None
+    try:
+        return verify_token(token)
+    except HTTPException:
+        return None
+
+
+# Dependency: user_id from the bearer token, no database access
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
+    return verify_token(token)
+
+
+# Dependency: user_id of a user that still exists (existence is cached)
+async def get_existing_user(user_id: str = Depends(get_current_user)) -> str:
+    if _existing_users.get(user_id):
+        return user_id
+
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"_id": 1})
+    if not user:
+        logger.error(f"User not found in database: {user_id}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    _existing_users.put(user_id, True, time.time() + USER_EXISTS_TTL)
+    return user_id
@@ -1,10 +1,11 @@
 import os
 import jwt as pyjwt
-import bcrypt
 from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta
 from models import UserCreate, UserLogin
+from pymongo.errors import DuplicateKeyError
 from database import users_collection
+from passwords import hash_password, verify_password
 from dotenv import load_dotenv
 from pydantic import BaseModel, EmailStr
 from typing import Optional
@@ -42,20 +43,25 @@ def create_jwt(user_id: str):
 # User Registration
 @auth_router.post("/signup")
 async def signup(user: UserCreate):
-    existing_user = await users_collection.find_one({"email": user.email})
-    if existing_user:
+    # Cheap check first so a known duplicate doesn't cost a bcrypt hash
+    if await users_collection.find_one({"email": user.email}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
+    hashed_password = await hash_password(user.password)
 
     new_user = {
         "username": user.username,
         "email": user.email,
         "password": hashed_password,
+        "xp": 0,  # The leaderboard rank filters compare on xp, so it must always be set
         "onboarding": {}  # Store onboarding data here
     }
 
-    result = await users_collection.insert_one(new_user)
+    # The unique email index (required at startup) settles concurrent signups.
+    try:
+        result = await users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     token = create_jwt(str(result.inserted_id))
     
     return {"message": "User registered successfully", "access_token": token}
@@ -64,8 +70,8 @@ async def signup(user: UserCreate):
 # User Login
 @auth_router.post("/login")
 async def login(user: UserLogin):
-    db_user = await users_collection.find_one({"email": user.email})
-    if not db_user or not bcrypt.checkpw(user.password.encode(), db_user["password"].encode()):
+    db_user = await users_collection.find_one({"email": user.email}, {"password": 1})
+    if not db_user or not await verify_password(user.password, db_user["password"]):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     token = create_jwt(str(db_user["_id"]))
@@ -0,0 +1,67 @@
+"""Compare the old live-feed decode/encode path with FrameCodec.
+
+Usage: python bench_frame_codec.py [--width 1280] [--height 720] [--frames 300]
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from frame_codec import FrameCodec, LIVE_ANALYSIS_WIDTH, LIVE_JPEG_QUALITY
+
+
+def make_jpeg(width, height):
+
+    # Smooth gradient plus noise compresses roughly like a webcam frame.
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.dstack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))])
+    frame += np.random.default_rng(0).normal(0, 12, frame.shape)
+    _, buffer = cv2.imencode(".jpg", np.clip(frame, 0, 255).astype(np.uint8), [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+
+    return buffer.tobytes()
+
+
+def baseline(data):
+
+    nparr = np.frombuffer(data, np.uint8)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    _, buffer = cv2.imencode(".jpg", frame)
+
+    return frame.shape, buffer.tobytes()
+
+
+def run(label, fn, data, frames):
+
+    shape, out = fn(data)
+    start = time.perf_counter()
+    for _ in range(frames):
+        fn(data)
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<10} {elapsed / frames * 1000:7.2f} ms/frame  "
+          f"analysis {shape[1]}x{shape[0]}  response {len(out) / 1024:6.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--analysis-width", type=int, default=LIVE_ANALYSIS_WIDTH)
+    parser.add_argument("--quality", type=int, default=LIVE_JPEG_QUALITY)
+    args = parser.parse_args()
+
+    data = make_jpeg(args.width, args.height)
+    codec = FrameCodec(analysis_width=args.analysis_width, jpeg_quality=args.quality)
+
+    def optimized(data):
+        frame = codec.decode(data)
+        return frame.shape, codec.encode(frame)
+
+    print(f"input {args.width}x{args.height} JPEG, {len(data) / 1024:.1f} KiB")
+    run("baseline", baseline, data, args.frames)
+    run("codec", optimized, data, args.frames)
+
+
+if __name__ == "__main__":
+    main()
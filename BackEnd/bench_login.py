@@ -0,0 +1,91 @@
+"""Login throughput and tail latency under concurrent load.
+
+Fires --requests POST /auth/login calls at --concurrency against a running
+server (creating the test account via /auth/signup first if needed) and
+reports throughput, latency percentiles and 503 back-pressure responses.
+Also probes /live-feed/stats during the run to show event-loop stalls.
+
+Usage: python bench_login.py --url http://127.0.0.1:8000 --concurrency 32 --requests 500
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def probe(url, stop, samples):
+    # A cheap endpoint's latency shows how long the event loop is blocked.
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            urllib.request.urlopen(url, timeout=60).read()
+            samples.append(time.perf_counter() - start)
+        except OSError:
+            pass
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--email", default="bench-login@example.com")
+    parser.add_argument("--password", default="bench-password")
+    args = parser.parse_args()
+
+    post(f"{args.url}/auth/signup", {"username": "bench-login", "email": args.email, "password": args.password})
+    credentials = {"email": args.email, "password": args.password}
+
+    def login(_):
+        start = time.perf_counter()
+        code = post(f"{args.url}/auth/login", credentials)
+        return code, time.perf_counter() - start
+
+    stop, probe_samples = threading.Event(), []
+    prober = threading.Thread(target=probe, args=(f"{args.url}/live-feed/stats", stop, probe_samples))
+    prober.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(login, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    prober.join()
+
+    ok = [t * 1000 for code, t in results if code == 200]
+    rejected = sum(1 for code, _ in results if code == 503)
+    other = len(results) - len(ok) - rejected
+    probe_ms = [t * 1000 for t in probe_samples]
+
+    print(f"{len(results)} logins at concurrency {args.concurrency} in {elapsed:.2f}s")
+    print(f"throughput: {len(ok) / elapsed:.1f} successful logins/s  (503: {rejected}, other errors: {other})")
+    print(f"login latency ms: p50 {percentile(ok, 50):.1f}  p90 {percentile(ok, 90):.1f}  "
+          f"p99 {percentile(ok, 99):.1f}  max {max(ok, default=float('nan')):.1f}")
+    print(f"concurrent /live-feed/stats latency ms: p50 {percentile(probe_ms, 50):.1f}  "
+          f"p99 {percentile(probe_ms, 99):.1f}  max {max(probe_ms, default=float('nan')):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Username prefix search latency at scale.
+
+Seeds --users synthetic users into a scratch database (BENCH_DB, default
+fitness_app_bench; never the app database), creates the username_ci index and
+times random 1-4 character prefix searches with and without the LRU cache.
+Also prints the winning plan to show the search is an IXSCAN.
+
+Usage: python bench_user_search.py --users 300000 --queries 2000
+"""
+import os
+import time
+import random
+import string
+import asyncio
+import argparse
+from pymongo import ASCENDING, IndexModel
+from database import client
+from user_search import UsernameSearch, USERNAME_COLLATION
+
+BENCH_DB = os.getenv("BENCH_DB", "fitness_app_bench")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def random_username(rng):
+    return rng.choice(string.ascii_letters) + "".join(
+        rng.choice(string.ascii_lowercase + string.digits + "_") for _ in range(rng.randint(4, 14))
+    )
+
+
+async def seed(collection, count, rng):
+    if await collection.estimated_document_count() >= count:
+        return
+    await collection.drop()
+    batch = []
+    for _ in range(count):
+        batch.append({"username": random_username(rng), "xp": rng.randint(0, 50000)})
+        if len(batch) == 10000:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def timed(search, prefixes):
+    latencies = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        await search.search(prefix)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    collection = client.get_database(BENCH_DB).get_collection("users")
+    await seed(collection, args.users, rng)
+    await collection.create_indexes([
+        IndexModel([("username", ASCENDING)], name="username_ci", collation=USERNAME_COLLATION)
+    ])
+
+    # Zipf-ish prefixes: short prefixes are typed far more often than long ones.
+    prefixes = [
+        random_username(rng)[:rng.choice([1, 1, 2, 2, 2, 3, 3, 4])].swapcase()
+        for _ in range(args.queries)
+    ]
+
+    explain = await collection.find(
+        {"username": {"$gte": "ab", "$lt": "ab\uffff"}}, collation=USERNAME_COLLATION
+    ).sort("username", 1).limit(10).explain()
+    print("winning plan:", explain["queryPlanner"]["winningPlan"])
+
+    for label, cache_size in (("uncached", 0), ("cached", 1024)):
+        search = UsernameSearch(collection, cache_size=cache_size)
+        latencies = await timed(search, prefixes)
+        print(f"{label:>8}: {len(latencies)} searches over {args.users} users  "
+              f"p50 {percentile(latencies, 50):.2f} ms  p90 {percentile(latencies, 90):.2f} ms  "
+              f"p99 {percentile(latencies, 99):.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
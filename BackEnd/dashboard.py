@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument
 from database import users_collection, db
+from auth import get_current_user, get_existing_user, user_id_from_token
+from user_loader import UserLoader, current_user_doc, get_user_loader
+from dashboard_cache import dashboard_cache, dashboard_etag, invalidate_user
+from leaderboard import top_entries, entries_around, rank_of
+from dashboard_events import (
+    event_bus, publish_streak, publish_friends_changed, sse, XP_CHANGED, SSE_HEARTBEAT
+)
+from weekly_progress import get_weekly_progress, parse_iso_datetime
+from user_search import username_search, USER_SEARCH_LIMIT
+from xp_ledger import period_leaderboard, PERIODS
 from bson import ObjectId
 from pydantic import BaseModel
 from typing import List, Optional
-import jwt as pyjwt
-import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+import asyncio
 import logging
 
 # Set up logging
@@ -18,8 +28,8 @@ load_dotenv()
 
 dashboard_router = APIRouter()
 
-JWT_SECRET = os.getenv("JWT_SECRET")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")  # Updated to match the full path
+# Friends shown on the dashboard; the rest are paged through /dashboard/friends
+DASHBOARD_FRIENDS = 50
 
 # Pydantic Models
 class FriendRequest(BaseModel):
@@ -31,146 +41,289 @@ class DashboardResponse(BaseModel):
     daily_streak: int
     weekly_goals: dict
     leaderboard: List[dict]
+    rank: Optional[int] = None
+    leaderboard_around_me: List[dict] = []
     friends: List[dict]
 
-# Dependency to get current user
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = pyjwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            raise credentials_exception
-    except pyjwt.ExpiredSignatureError:
-        logger.error("Token expired")
-        raise credentials_exception
-    except pyjwt.PyJWTError as e:
-        logger.error(f"JWT error: {str(e)}")
-        raise credentials_exception
-    return user_id
-
-# Calculate daily streak based on login attempts
-async def calculate_daily_streak(user_id: str) -> int:
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    streak = user.get("daily_streak", 0)
-    last_login = user.get("last_login", None)
+# Calculate daily streak based on login days (user must include daily_streak and last_login)
+async def calculate_daily_streak(user: dict) -> int:
     now = datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    yesterday = today - timedelta(days=1)
+
+    # Already counted today: nothing to write
+    last_login = user.get("last_login")
+    if isinstance(last_login, datetime) and last_login >= today:
+        return user.get("daily_streak", 1)
 
-    if last_login:
-        last_login_date = datetime.fromisoformat(last_login) if isinstance(last_login, str) else last_login
-        time_diff = now - last_login_date
-        
-        if time_diff <= timedelta(hours=24):
-            # Same day or within 24 hours, streak continues
-            pass
-        elif time_diff <= timedelta(hours=48):
-            # Missed one day, increment streak
-            streak += 1
-        else:
-            # Missed more than one day, reset streak
-            streak = 1
-    else:
-        streak = 1  # First login
-
-    # Update last_login and streak
-    await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"last_login": now.isoformat(), "daily_streak": streak}}
+    # One atomic read-modify-write; the filter makes concurrent tabs update at most once a day.
+    # Older documents store last_login as a naive datetime.isoformat() string.
+    updated = await users_collection.find_one_and_update(
+        {
+            "_id": user["_id"],
+            "$or": [{"last_login": {"$lt": today}}, {"last_login": {"$not": {"$type": "date"}}}]
+        },
+        [
+            {"$set": {"_last_login": parse_iso_datetime("$last_login")}},
+            {"$set": {
+                "daily_streak": {"$switch": {
+                    "branches": [
+                        {  # Legacy string from earlier today: already counted
+                            "case": {"$and": [{"$eq": [{"$type": "$_last_login"}, "date"]},
+                                              {"$gte": ["$_last_login", today]}]},
+                            "then": {"$ifNull": ["$daily_streak", 1]}
+                        },
+                        {  # Logged in yesterday
+                            "case": {"$and": [{"$eq": [{"$type": "$_last_login"}, "date"]},
+                                              {"$gte": ["$_last_login", yesterday]}]},
+                            "then": {"$add": [{"$ifNull": ["$daily_streak", 0]}, 1]}
+                        },
+                    ],
+                    "default": 1  # First login or missed a day
+                }},
+                "last_login": now
+            }},
+            {"$unset": "_last_login"}
+        ],
+        projection={"daily_streak": 1},
+        return_document=ReturnDocument.AFTER
     )
-    return streak
+    if updated is None:
+        # Another request already counted today
+        updated = await users_collection.find_one({"_id": user["_id"]}, {"daily_streak": 1}) or {}
+        return updated.get("daily_streak", 1)
 
-# Calculate weekly goals based on completed workouts
+    publish_streak(str(user["_id"]), updated.get("daily_streak", 1))
+    return updated.get("daily_streak", 1)
+
+# Weekly goals from the materialized weekly_progress counters
 async def calculate_weekly_goals(user_id: str) -> dict:
-    now = datetime.utcnow()
-    week_start = now - timedelta(days=now.weekday())  # Start of the week (Monday)
-    
-    workouts = await db.get_collection("workouts").find({
-        "user_id": ObjectId(user_id),
-        "completed": True,
-        "completed_at": {"$gte": week_start.isoformat()}
-    }).to_list(length=100)
-    
-    completed_count = len(workouts)
+    progress = await get_weekly_progress(ObjectId(user_id))
     goal = 5  # Default weekly workout goal
-    return {"completed": completed_count, "goal": goal}
+    return {**progress, "goal": goal}
+
+# Fetch friends' public data in one $in query, keeping the order of friend_ids
+async def load_friends(friend_ids: list) -> List[dict]:
+    # Older documents store friend ids as strings
+    friend_ids = [ObjectId(friend_id) for friend_id in friend_ids]
+    if not friend_ids:
+        return []
 
-# Get dashboard data
+    friends = await users_collection.find(
+        {"_id": {"$in": friend_ids}}, {"username": 1, "xp": 1}
+    ).to_list(length=len(friend_ids))
+    by_id = {friend["_id"]: friend for friend in friends}
+
+    return [
+        {
+            "name": by_id[friend_id]["username"],
+            "status": "Last active recently",  # Simplified status for now
+            "xp": by_id[friend_id].get("xp", 0)
+        }
+        for friend_id in friend_ids if friend_id in by_id
+    ]
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+# Get dashboard data; revalidate with If-None-Match to get a 304 without loading the user
 @dashboard_router.get("/dashboard", response_model=DashboardResponse)
-async def get_dashboard(user_id: str = Depends(get_current_user)):
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    user_id: str = Depends(get_current_user),
+    loader: UserLoader = Depends(get_user_loader)
+):
+    etag = await dashboard_etag(user_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    cached = await dashboard_cache.get(user_id)
+    if cached is not None and cached[0] == etag:
+        return cached[1]
+
+    user = await loader.get(user_id, ["username", "xp", "friends", "daily_streak", "last_login"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Calculate daily streak
-    daily_streak = await calculate_daily_streak(user_id)
+    daily_streak = await calculate_daily_streak(user)
 
     # Calculate weekly goals
     weekly_goals = await calculate_weekly_goals(user_id)
 
-    # Fetch all users for leaderboard
-    all_users = await users_collection.find().to_list(length=100)
-    leaderboard = [
-        {"name": u["username"], "points": u.get("xp", 0), "rank": 0}
-        for u in all_users
-    ]
-    # Sort leaderboard by XP in descending order
-    leaderboard.sort(key=lambda x: x["points"], reverse=True)
-    # Assign ranks
-    for i, entry in enumerate(leaderboard, 1):
-        entry["rank"] = i
-        if entry["name"] == user["username"]:
-            entry["name"] += " (You)"
+    # Top of the leaderboard comes from the shared snapshot; the caller's rank is exact
+    leaderboard = await top_entries(user["_id"], 4)
+    rank, around_me = await entries_around(user, 2)
 
     # Fetch friends
-    friends_list = user.get("friends", [])
-    friends_data = []
-    for friend_id in friends_list:
-        friend = await users_collection.find_one({"_id": ObjectId(friend_id)})
-        if friend:
-            status = "Last active recently"  # Simplified status for now
-            friends_data.append({
-                "name": friend["username"],
-                "status": status,
-                "xp": friend.get("xp", 0)
-            })
-
-    return {
+    friends_data = await load_friends(user.get("friends", [])[:DASHBOARD_FRIENDS])
+
+    dashboard = {
         "username": user["username"],
         "xp": user.get("xp", 0),
         "daily_streak": daily_streak,
         "weekly_goals": weekly_goals,
-        "leaderboard": leaderboard[:4],  # Top 4 for display
+        "leaderboard": leaderboard,  # Top 4 for display
+        "rank": rank,
+        "leaderboard_around_me": around_me,
         "friends": friends_data
     }
+    await dashboard_cache.set(user_id, etag, dashboard)
+    return dashboard
 
-# Add friend
-@dashboard_router.post("/dashboard/add-friend")
-async def add_friend(friend_request: FriendRequest, user_id: str = Depends(get_current_user)):
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+async def dashboard_event_stream(request: Request, user_id: str):
+    queue = event_bus.subscribe(user_id)
+    try:
+        user = await users_collection.find_one(
+            {"_id": ObjectId(user_id)}, {"username": 1, "xp": 1, "friends": 1, "daily_streak": 1}
+        )
+        if not user:
+            return
+        xp = user.get("xp", 0)
+        friends = {str(friend_id) for friend_id in user.get("friends", [])}
+        rank = await rank_of(user)
+        own_id = ObjectId(user_id)
+
+        def ranks_ahead(other_xp, other_id):
+            # 1 if a user with other_xp sorts ahead of us in (xp desc, _id asc) order
+            return int(other_xp > xp or (other_xp == xp and other_id < own_id))
+
+        # Initial state, then only deltas
+        yield "retry: 5000\n\n"
+        yield sse("snapshot", {
+            "xp": xp,
+            "daily_streak": user.get("daily_streak", 0),
+            "weekly_progress": await calculate_weekly_goals(user_id),
+            "rank": rank,
+        })
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": heartbeat\n\n"
+                continue
+
+            kind = event["type"]
+            if kind == "xp":
+                xp = event["xp"]
+            elif kind == "friends_changed":
+                user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"friends": 1}) or {}
+                friends = {str(friend_id) for friend_id in user.get("friends", [])}
+            elif kind == XP_CHANGED:
+                if event["user_id"] in friends:
+                    yield sse("friend_xp", {"name": event["username"], "xp": event["new_xp"]})
+                if event["user_id"] == user_id:
+                    # Our own change: recount once
+                    new_rank = await rank_of({"_id": own_id, "xp": xp})
+                else:
+                    # Someone else passing us (or dropping behind) moves us by one, no query needed
+                    other_id = ObjectId(event["user_id"])
+                    new_rank = rank + ranks_ahead(event["new_xp"], other_id) - ranks_ahead(event["old_xp"], other_id)
+                if new_rank != rank:
+                    rank = new_rank
+                    yield sse("rank", {"rank": rank})
+                continue
+
+            yield sse(kind, {key: value for key, value in event.items() if key != "type"})
+    finally:
+        event_bus.unsubscribe(user_id, queue)
+
+# Server-sent dashboard deltas; EventSource cannot set headers, so ?token= is accepted too
+@dashboard_router.get("/dashboard/events")
+async def dashboard_events(request: Request, token: Optional[str] = Query(None)):
+    if token is None:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else None
+    user_id = user_id_from_token(token)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    return StreamingResponse(
+        dashboard_event_stream(request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Leaderboard page: top entries plus the window around the caller
+@dashboard_router.get("/dashboard/leaderboard")
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=100),
+    window: int = Query(5, ge=0, le=50),
+    user: dict = Depends(current_user_doc("username", "xp"))
+):
+    top = await top_entries(user["_id"], limit)
+    rank, around_me = await entries_around(user, window)
+    return {"top": top, "rank": rank, "around_me": around_me}
+
+# Page through the caller's friends
+@dashboard_router.get("/dashboard/friends")
+async def get_friends(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(DASHBOARD_FRIENDS, ge=1, le=200),
+    user_id: str = Depends(get_current_user)
+):
+    user = await users_collection.find_one(
+        {"_id": ObjectId(user_id)}, {"_id": 1, "friends": {"$slice": [skip, limit]}}
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    friend = await users_collection.find_one({"username": friend_request.username})
+    page = user.get("friends", [])
+    friends = await load_friends(page)
+    return {"friends": friends, "next_skip": skip + limit if len(page) == limit else None}
+
+# XP earned in the current day, week or season, from the rolled-up totals
+@dashboard_router.get("/dashboard/leaderboard/{period}")
+async def get_period_leaderboard(
+    period: str,
+    limit: int = Query(10, ge=1, le=100),
+    user_id: str = Depends(get_current_user)
+):
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"Period must be one of: {', '.join(PERIODS)}")
+
+    entries = await period_leaderboard(period, limit)
+    for entry in entries:
+        if entry.pop("user_id") == user_id:
+            entry["name"] += " (You)"
+    return {"period": period, "leaderboard": entries}
+
+# Typeahead for adding friends: usernames starting with q, case-insensitive
+@dashboard_router.get("/dashboard/users/search")
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=32),
+    limit: int = Query(USER_SEARCH_LIMIT, ge=1, le=25),
+    user_id: str = Depends(get_current_user)
+):
+    # One extra so dropping the caller still fills the page
+    results = await username_search.search(q, limit + 1)
+    return {"users": [user for user in results if user["id"] != user_id][:limit]}
+
+# Add friend
+@dashboard_router.post("/dashboard/add-friend")
+async def add_friend(friend_request: FriendRequest, user_id: str = Depends(get_existing_user)):
+    friend = await users_collection.find_one({"username": friend_request.username}, {"_id": 1})
     if not friend:
         raise HTTPException(status_code=404, detail="Friend not found")
     
     if str(friend["_id"]) == user_id:
         raise HTTPException(status_code=400, detail="Cannot add yourself as a friend")
 
-    friends_list = user.get("friends", [])
-    if str(friend["_id"]) in friends_list:
+    # Single conditional $addToSet; the filter also matches legacy string ids
+    result = await users_collection.update_one(
+        {"_id": ObjectId(user_id), "friends": {"$nin": [friend["_id"], str(friend["_id"])]}},
+        {"$addToSet": {"friends": friend["_id"]}}
+    )
+    if result.matched_count == 0:
         raise HTTPException(status_code=400, detail="Friend already added")
 
-    friends_list.append(str(friend["_id"]))
-    await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"friends": friends_list}}
-    )
+    await invalidate_user(user_id)
+    publish_friends_changed(user_id)
     return {"message": f"Friend {friend_request.username} added successfully"}
\ No newline at end of file
@@ -0,0 +1,131 @@
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from database import db, users_collection
+from leaderboard import leaderboard_snapshot
+
+# Dashboard payloads are cached per user under an ETag built from version
+# stamps bumped by the events that change them: the user's own version
+# (workout completed, XP awarded, friend added, profile edited, a friend's XP
+# or name changed), a shared leaderboard version (bumped only when a change
+# shows up in the top-K snapshot) and the UTC day (streak and weekly goals roll
+# over). The caller's exact rank and the window around it are refreshed with
+# those; live rank changes in between are pushed over /dashboard/events. A
+# matching If-None-Match is answered with 304 without loading the user.
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "10000"))
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", str(24 * 3600)))
+
+# "memory" keeps versions and payloads in this process; "mongo" shares them across workers.
+DASHBOARD_CACHE_BACKEND = os.getenv("DASHBOARD_CACHE_BACKEND", "memory")
+
+LEADERBOARD_VERSION = "leaderboard"
+
+
+class MemoryDashboardCache:
+    """In-process backend. Versions live only in this process, so with several
+    workers use the mongo backend."""
+
+    def __init__(self, maxsize=DASHBOARD_CACHE_SIZE):
+        self.maxsize = maxsize
+        # A fresh epoch per process keeps ETags from an earlier process from matching.
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._payloads = OrderedDict()  # user_id -> (etag, payload)
+
+    async def versions(self, *keys):
+        return [self._versions.get(key, 0) for key in keys]
+
+    async def bump(self, key):
+        self._versions[key] = self._versions.get(key, 0) + 1
+        if len(self._versions) > self.maxsize * 2:
+            # Dropping versions is safe: a dropped key restarts at 0 under a new epoch.
+            self._versions.clear()
+            self.epoch = uuid.uuid4().hex[:8]
+
+    async def get(self, user_id):
+        entry = self._payloads.get(user_id)
+        if entry is not None:
+            self._payloads.move_to_end(user_id)
+        return entry
+
+    async def set(self, user_id, etag, payload):
+        self._payloads[user_id] = (etag, payload)
+        self._payloads.move_to_end(user_id)
+        while len(self._payloads) > self.maxsize:
+            self._payloads.popitem(last=False)
+
+    async def ensure_indexes(self):
+        pass
+
+
+class MongoDashboardCache:
+    """Shared backend: every worker sees the same versions and payloads, at the
+    cost of one indexed lookup per revalidation."""
+
+    # Versions persist in MongoDB, so ETags stay valid across restarts.
+    epoch = "m"
+
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL):
+        self.ttl = ttl
+        self.versions_collection = db.get_collection("dashboard_versions")
+        # Expired payloads are removed by a TTL index on expires_at.
+        self.payloads_collection = db.get_collection("dashboard_payloads")
+
+    async def versions(self, *keys):
+        docs = await self.versions_collection.find({"_id": {"$in": list(keys)}}).to_list(length=len(keys))
+        found = {doc["_id"]: doc["v"] for doc in docs}
+        return [found.get(key, 0) for key in keys]
+
+    async def bump(self, key):
+        await self.versions_collection.update_one({"_id": key}, {"$inc": {"v": 1}}, upsert=True)
+
+    async def get(self, user_id):
+        doc = await self.payloads_collection.find_one({"_id": user_id})
+        return (doc["etag"], doc["payload"]) if doc else None
+
+    async def set(self, user_id, etag, payload):
+        await self.payloads_collection.replace_one(
+            {"_id": user_id},
+            {"etag": etag, "payload": payload, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)},
+            upsert=True,
+        )
+
+    async def ensure_indexes(self):
+        await self.payloads_collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+def create_dashboard_cache(backend=DASHBOARD_CACHE_BACKEND):
+    if backend == "memory":
+        return MemoryDashboardCache()
+    if backend == "mongo":
+        return MongoDashboardCache()
+    raise ValueError(f"Unknown DASHBOARD_CACHE_BACKEND: {backend}")
+
+
+dashboard_cache = create_dashboard_cache()
+
+
+async def dashboard_etag(user_id: str) -> str:
+    user_version, leaderboard_version = await dashboard_cache.versions(f"user:{user_id}", LEADERBOARD_VERSION)
+    return f'W/"{dashboard_cache.epoch}-{user_version}-{leaderboard_version}-{datetime.utcnow():%Y%m%d}"'
+
+
+async def invalidate_user(user_id):
+    """The user's own dashboard changed (friends, profile, completions)."""
+    await dashboard_cache.bump(f"user:{user_id}")
+
+
+async def invalidate_shared(user_id, xp=None):
+    """A change other users see too (XP, username): the user's own dashboard,
+    the dashboards listing them as a friend and, only when the change shows up
+    in the top-K snapshot, every dashboard."""
+    await dashboard_cache.bump(f"user:{user_id}")
+    followers = await users_collection.find({"friends": ObjectId(user_id)}, {"_id": 1}).to_list(length=None)
+    for follower in followers:
+        await dashboard_cache.bump(f"user:{follower['_id']}")
+
+    if leaderboard_snapshot.affected_by(user_id, xp):
+        leaderboard_snapshot.invalidate()
+        await dashboard_cache.bump(LEADERBOARD_VERSION)
@@ -0,0 +1,86 @@
+import os
+import json
+import asyncio
+import logging
+from collections import defaultdict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# In-process publish/subscribe bus feeding the dashboard SSE stream. Each
+# connection owns a bounded queue; when a slow client falls behind, its
+# oldest events are dropped rather than blocking the publisher.
+DASHBOARD_EVENT_QUEUE = int(os.getenv("DASHBOARD_EVENT_QUEUE", "256"))
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+
+# Broadcast when any user's XP changes; each stream decides locally whether it
+# affects its own rank or one of its friends.
+XP_CHANGED = "xp_changed"
+
+
+def sse(event: str, data: dict) -> str:
+    """One server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventBus:
+
+    def __init__(self, queue_size=DASHBOARD_EVENT_QUEUE):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)  # user_id -> queues
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def connections(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _put(self, queue, event):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(event)
+
+    def publish(self, user_id, event):
+        for queue in self._subscribers.get(str(user_id), ()):
+            self._put(queue, event)
+
+    def broadcast(self, event):
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._put(queue, event)
+
+
+event_bus = EventBus()
+
+
+def publish_xp(user_id, username, old_xp, new_xp):
+    user_id = str(user_id)
+    event_bus.publish(user_id, {"type": "xp", "xp": new_xp})
+    if event_bus.connections():
+        event_bus.broadcast({
+            "type": XP_CHANGED, "user_id": user_id, "username": username,
+            "old_xp": old_xp, "new_xp": new_xp,
+        })
+
+
+def publish_streak(user_id, streak):
+    event_bus.publish(user_id, {"type": "streak", "daily_streak": streak})
+
+
+def publish_weekly_progress(user_id, progress):
+    event_bus.publish(user_id, {"type": "weekly_progress", **progress})
+
+
+def publish_friends_changed(user_id):
+    event_bus.publish(user_id, {"type": "friends_changed"})
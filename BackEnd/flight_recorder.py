@@ -0,0 +1,103 @@
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+
+# Per-session ring buffer of live-feed stage timings, exportable as a Chrome
+# trace-event file (opens in Perfetto / chrome://tracing). Opt-in per
+# connection with ?trace=1, or for every session with FLIGHT_RECORDER_ALL=1.
+FLIGHT_RECORDER_EVENTS = int(os.getenv("FLIGHT_RECORDER_EVENTS", "20000"))
+FLIGHT_RECORDER_SESSIONS = int(os.getenv("FLIGHT_RECORDER_SESSIONS", "32"))
+FLIGHT_RECORDER_ALL = os.getenv("FLIGHT_RECORDER_ALL", "0") == "1"
+
+
+class _Span:
+
+    __slots__ = ("recorder", "name", "args", "start")
+
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.complete(self.name, self.start, **self.args)
+        return False
+
+
+class FlightRecorder:
+
+    enabled = True
+
+    def __init__(self, session_id, capacity=FLIGHT_RECORDER_EVENTS):
+        self.session_id = session_id
+        self.origin = time.perf_counter()
+        # (phase, name, start, duration, args); oldest events fall off the end.
+        self.events = deque(maxlen=capacity)
+
+    def span(self, name, **args):
+        return _Span(self, name, args)
+
+    def complete(self, name, start, end=None, **args):
+        end = time.perf_counter() if end is None else end
+        self.events.append(("X", name, start, end - start, args))
+
+    def instant(self, name, **args):
+        self.events.append(("i", name, time.perf_counter(), 0.0, args))
+
+    def to_chrome_trace(self):
+        trace_events = [{
+            "ph": "M", "name": "thread_name", "pid": 1, "tid": 1,
+            "args": {"name": f"live-feed {self.session_id}"},
+        }]
+        for phase, name, start, duration, args in list(self.events):
+            event = {
+                "ph": phase, "name": name, "pid": 1, "tid": 1,
+                "ts": round((start - self.origin) * 1e6, 1),
+                "args": args,
+            }
+            if phase == "X":
+                event["dur"] = round(duration * 1e6, 1)
+            else:
+                event["s"] = "t"
+            trace_events.append(event)
+
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+class NullRecorder:
+    """Stand-in used when recording is off: every call is a no-op."""
+
+    enabled = False
+    _null_span = nullcontext()
+
+    def span(self, name, **args):
+        return self._null_span
+
+    def complete(self, name, start, end=None, **args):
+        pass
+
+    def instant(self, name, **args):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+
+# Recorders of recent sessions, kept after disconnect so they can still be dumped.
+flight_recorders = OrderedDict()
+
+
+def get_flight_recorder(session_id, enabled):
+    if not (enabled or FLIGHT_RECORDER_ALL):
+        return NULL_RECORDER
+
+    recorder = flight_recorders.pop(session_id, None) or FlightRecorder(session_id)
+    flight_recorders[session_id] = recorder
+    while len(flight_recorders) > FLIGHT_RECORDER_SESSIONS:
+        flight_recorders.popitem(last=False)
+
+    return recorder
@@ -0,0 +1,101 @@
+import os
+import cv2
+import numpy as np
+
+# Width (px) the pose analysis runs at and JPEG quality of the annotated frames sent back.
+LIVE_ANALYSIS_WIDTH = int(os.getenv("LIVE_ANALYSIS_WIDTH", "640"))
+LIVE_JPEG_QUALITY = int(os.getenv("LIVE_JPEG_QUALITY", "80"))
+
+# libjpeg can decode straight to 1/2, 1/4 and 1/8 scale, skipping most of the IDCT work.
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def choose_decode_scale(source_width, analysis_width):
+
+    # Largest reduction that still keeps the frame at least analysis_width wide.
+    scale = 1
+    for candidate in (2, 4, 8):
+        if source_width // candidate >= analysis_width:
+            scale = candidate
+
+    return scale
+
+
+class FrameCodec:
+    """Per-session JPEG decode/encode for the live feed."""
+
+    def __init__(self, analysis_width=LIVE_ANALYSIS_WIDTH, jpeg_quality=LIVE_JPEG_QUALITY):
+
+        self.analysis_width = analysis_width
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+
+        # Negotiated from the first frame, renegotiated if the client changes resolution.
+        self.scale = None
+        self.source_width = None
+
+        # Preallocated resize target, reused while the frame size stays the same.
+        self.frame_buffer = None
+
+
+    def _negotiate(self, nparr):
+
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+
+        self.source_width = frame.shape[1]
+        self.scale = choose_decode_scale(self.source_width, self.analysis_width)
+
+        if self.scale > 1:
+            frame = cv2.resize(frame, (frame.shape[1] // self.scale, frame.shape[0] // self.scale),
+                               interpolation=cv2.INTER_AREA)
+
+        return frame
+
+
+    def _fit(self, frame):
+
+        # Reduced decoding only goes in powers of two; bring anything still
+        # clearly wider than the analysis size down into the reused buffer.
+        height, width, _ = frame.shape
+        if width <= self.analysis_width * 1.25:
+            return frame
+
+        target_height = int(height * self.analysis_width / width)
+        if self.frame_buffer is None or self.frame_buffer.shape[:2] != (target_height, self.analysis_width):
+            self.frame_buffer = np.empty((target_height, self.analysis_width, 3), dtype=np.uint8)
+
+        cv2.resize(frame, (self.analysis_width, target_height), dst=self.frame_buffer, interpolation=cv2.INTER_AREA)
+
+        return self.frame_buffer
+
+
+    def decode(self, data):
+
+        nparr = np.frombuffer(data, np.uint8)
+
+        if self.scale is None:
+            frame = self._negotiate(nparr)
+        else:
+            frame = cv2.imdecode(nparr, REDUCED_DECODE_FLAGS[self.scale])
+
+            # Client switched resolution: renegotiate the decode scale.
+            if frame is not None and abs(frame.shape[1] * self.scale - self.source_width) >= self.scale:
+                frame = self._negotiate(nparr)
+
+        if frame is None:
+            return None
+
+        return self._fit(frame)
+
+
+    def encode(self, frame):
+
+        ok, buffer = cv2.imencode(".jpg", frame, self.encode_params)
+
+        return buffer.tobytes() if ok else None
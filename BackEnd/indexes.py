@@ -0,0 +1,158 @@
+"""MongoDB index bootstrap and query-plan checks.
+
+ensure_indexes() runs at startup and creates every index the routes rely on;
+create_indexes is idempotent, so restarting is cheap. Run this module
+directly to create the indexes and explain() each hot query, failing if any
+of them would fall back to a collection scan:
+
+    python indexes.py --explain
+"""
+import sys
+import asyncio
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+from database import db
+from session_store import session_store
+from dashboard_cache import dashboard_cache
+from angle_series import ensure_indexes as ensure_angle_indexes
+from user_search import USERNAME_COLLATION
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        # Signup relies on this to reject duplicate emails atomically.
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username"),
+        # Case-insensitive prefix search for the friend typeahead.
+        IndexModel([("username", ASCENDING)], name="username_ci", collation=USERNAME_COLLATION),
+        # Leaderboard order: top-K scans, rank counts and rank-around-me windows.
+        IndexModel([("xp", DESCENDING), ("_id", ASCENDING)], name="xp_desc_id"),
+        IndexModel([("friends", ASCENDING)], name="friends"),
+    ],
+    "workouts": [
+        IndexModel([("user_id", ASCENDING), ("completed", ASCENDING), ("completed_at", ASCENDING)],
+                   name="user_completed_at"),
+    ],
+    "mealplans": [
+        IndexModel([("user_id", ASCENDING), ("week_start", ASCENDING)], name="user_week_unique", unique=True),
+    ],
+    "rep_events": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING)], name="session_timestamp"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", ASCENDING)], name="user_timestamp"),
+    ],
+    "feedback": [
+        # Keyset pagination on (submitted_at, _id), newest first.
+        IndexModel([("user_id", ASCENDING), ("submitted_at", DESCENDING), ("_id", DESCENDING)],
+                   name="user_submitted_at_id"),
+    ],
+    "weekly_progress": [
+        # Also the $merge key of the weekly_progress rebuild.
+        IndexModel([("user_id", ASCENDING), ("week_start", ASCENDING)], name="user_week_unique", unique=True),
+    ],
+    "xp_ledger": [
+        IndexModel([("ts", ASCENDING)], name="ts"),
+        IndexModel([("user_id", ASCENDING), ("ts", ASCENDING)], name="user_ts"),
+    ],
+    "xp_totals": [
+        # $merge key of the XP rollups.
+        IndexModel([("user_id", ASCENDING), ("period", ASCENDING), ("period_start", ASCENDING)],
+                   name="user_period_unique", unique=True),
+        IndexModel([("period", ASCENDING), ("period_start", ASCENDING), ("xp", DESCENDING)], name="period_xp"),
+    ],
+    "pending_workouts": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "workout_sessions": [
+        IndexModel([("user_id", ASCENDING), ("ended_at", DESCENDING)], name="user_ended_at"),
+    ],
+}
+
+# (collection, filter, sort[, find options]) of the queries that run on hot paths.
+_sample_id = ObjectId()
+HOT_QUERIES = [
+    ("users", {"email": "explain@example.com"}, None),
+    ("users", {"username": "explain"}, None),
+    ("users", {"username": {"$gte": "ex", "$lt": "ex\uffff"}}, [("username", ASCENDING)],
+     {"collation": USERNAME_COLLATION}),
+    ("users", {}, [("xp", DESCENDING), ("_id", ASCENDING)]),
+    ("users", {"$or": [{"xp": {"$gt": 0}}, {"xp": 0, "_id": {"$lt": _sample_id}}]}, [("xp", ASCENDING), ("_id", DESCENDING)]),
+    ("workouts", {"user_id": _sample_id, "completed": True, "completed_at": {"$gte": "2024-01-01"}}, None),
+    ("workouts", {"user_id": _sample_id}, None),
+    ("mealplans", {"user_id": str(_sample_id), "week_start": "2024-01-01"}, None),
+    ("rep_events", {"session_id": "explain"}, [("timestamp", ASCENDING)]),
+    ("feedback", {"user_id": _sample_id, "$or": [
+        {"submitted_at": {"$lt": datetime(2024, 1, 1)}},
+        {"submitted_at": datetime(2024, 1, 1), "_id": {"$lt": _sample_id}},
+    ]}, [("submitted_at", DESCENDING), ("_id", DESCENDING)]),
+    ("weekly_progress", {"user_id": _sample_id, "week_start": datetime(2024, 1, 1)}, None),
+    ("xp_totals", {"period": "week", "period_start": datetime(2024, 1, 1)}, [("xp", DESCENDING)]),
+]
+
+
+async def ensure_indexes():
+    """Create every index; raises if a unique index cannot be built, since
+    routes such as signup rely on it to reject duplicates."""
+    for name, models in INDEXES.items():
+        collection = db.get_collection(name)
+        for model in models:
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                if model.document.get("unique"):
+                    # Most likely existing duplicates; serving without the index would accept more.
+                    raise RuntimeError(f"Unique index {model.document['name']} on {name} failed: {e}") from e
+                logger.error(f"Failed to create index {model.document['name']} on {name}: {e}")
+        logger.info(f"Indexes on {name}: {', '.join(model.document['name'] for model in models)}")
+
+    # Users created before signup set xp would be invisible to leaderboard rank queries.
+    backfilled = await db.get_collection("users").update_many({"xp": {"$exists": False}}, {"$set": {"xp": 0}})
+    if backfilled.modified_count:
+        logger.info(f"Set xp to 0 on {backfilled.modified_count} users")
+
+    await session_store.ensure_indexes()
+    await dashboard_cache.ensure_indexes()
+    await ensure_angle_indexes()
+
+
+def _plan_stages(plan):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def explain_hot_queries():
+    """Return (collection, filter, stages) for every hot query not served by an index."""
+    failures = []
+    for name, query, sort, *options in HOT_QUERIES:
+        cursor = db.get_collection(name).find(query, **(options[0] if options else {}))
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = list(_plan_stages(explain["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages or "IXSCAN" not in stages:
+            failures.append((name, query, stages))
+        logger.info(f"{name} {query} sort={sort}: {' <- '.join(filter(None, stages))}")
+    return failures
+
+
+async def main():
+    await ensure_indexes()
+    if "--explain" not in sys.argv:
+        return 0
+
+    failures = await explain_hot_queries()
+    for name, query, stages in failures:
+        logger.error(f"Unindexed query on {name}: {query} ({' <- '.join(filter(None, stages))})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,106 @@
+import json
+
+
+class IncrementalObjectParser:
+    """Incremental parser for one JSON object arriving in text chunks.
+
+    feed() returns events as soon as they are complete:
+      ("field", key, value)  a top-level member other than an array
+      ("item", key, value)   an object element of a top-level array member
+
+    Text before the first "{" (such as a ```json fence) is skipped. Each
+    complete value is decoded with json.loads from its slice of the buffer;
+    close() decodes the whole object once the stream ends.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.expect_key = False
+        self.key = None
+        self.value_start = None
+        self.item_start = None
+        self.end = None
+
+    def feed(self, text):
+        if self.end is not None:
+            return []
+        if not self.started:
+            text = self.buffer + text
+            brace = text.find("{")
+            if brace < 0:
+                self.buffer = text[-16:]
+                return []
+            text = text[brace:]
+            self.buffer = ""
+            self.started = True
+
+        self.buffer += text
+        events = []
+        buffer = self.buffer
+
+        for i in range(self.pos, len(buffer)):
+            char = buffer[i]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect_key:
+                        self.key = json.loads(buffer[self.string_start:i + 1])
+                        self.expect_key = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+            elif char == ":" and self.depth == 1:
+                self.value_start = i + 1
+            elif char in "{[":
+                if char == "{" and self.depth == 2 and self._value_is_array(buffer):
+                    self.item_start = i
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+            elif char in "}]":
+                self.depth -= 1
+                if char == "}" and self.depth == 2 and self.item_start is not None:
+                    events.append(("item", self.key, json.loads(buffer[self.item_start:i + 1])))
+                    self.item_start = None
+                elif self.depth == 0:
+                    self._end_member(buffer, i, events)
+                    self.end = i + 1
+                    self.pos = i + 1
+                    return events
+            elif char == "," and self.depth == 1:
+                self._end_member(buffer, i, events)
+                self.expect_key = True
+
+        self.pos = len(buffer)
+        return events
+
+    def _value_is_array(self, buffer):
+        return self.value_start is not None and buffer[self.value_start:].lstrip().startswith("[")
+
+    def _end_member(self, buffer, i, events):
+        if self.key is None or self.value_start is None:
+            return
+        raw = buffer[self.value_start:i].strip()
+        if raw and not raw.startswith("["):
+            events.append(("field", self.key, json.loads(raw)))
+        self.key = None
+        self.value_start = None
+
+    def close(self):
+        """The complete object; raises ValueError if the stream ended early."""
+        if self.end is None:
+            raise ValueError("JSON object is incomplete")
+        return json.loads(self.buffer[:self.end])
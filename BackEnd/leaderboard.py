@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+from pymongo import ASCENDING, DESCENDING
+from database import users_collection
+
+# Leaderboard order is xp descending with _id as tie-breaker, served by the
+# users (xp, _id) index. The top LEADERBOARD_SIZE entries are cached in-process
+# for LEADERBOARD_TTL seconds and shared by every request.
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "10"))
+
+LEADERBOARD_ORDER = [("xp", DESCENDING), ("_id", ASCENDING)]
+_REVERSE_ORDER = [("xp", ASCENDING), ("_id", DESCENDING)]
+_PROJECTION = {"username": 1, "xp": 1}
+
+
+def _ahead_of(xp, user_id):
+    """Filter for users ranked above (xp, user_id)."""
+    return {"$or": [{"xp": {"$gt": xp}}, {"xp": xp, "_id": {"$lt": user_id}}]}
+
+
+def _behind(xp, user_id):
+    """Filter for users ranked below (xp, user_id)."""
+    return {"$or": [{"xp": {"$lt": xp}}, {"xp": xp, "_id": {"$gt": user_id}}]}
+
+
+def _entry(user, rank, user_id):
+    return {
+        "name": user["username"] + (" (You)" if user["_id"] == user_id else ""),
+        "points": user.get("xp", 0),
+        "rank": rank,
+    }
+
+
+class LeaderboardSnapshot:
+
+    def __init__(self, size=LEADERBOARD_SIZE, ttl=LEADERBOARD_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.users = []
+        self.expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def top(self):
+        if time.monotonic() < self.expires_at:
+            return self.users
+
+        # Only one request refreshes an expired snapshot; the rest wait for it.
+        async with self._lock:
+            if time.monotonic() >= self.expires_at:
+                self.users = await users_collection.find({}, _PROJECTION) \
+                    .sort(LEADERBOARD_ORDER).limit(self.size).to_list(length=self.size)
+                self.expires_at = time.monotonic() + self.ttl
+        return self.users
+
+    def affected_by(self, user_id, xp=None):
+        """Whether a change to this user (new xp, if it changed) would show in the snapshot."""
+        if any(str(user["_id"]) == str(user_id) for user in self.users):
+            return True
+        if xp is None:
+            return False
+        return len(self.users) < self.size or xp >= self.users[-1].get("xp", 0)
+
+    def invalidate(self):
+        self.expires_at = 0.0
+
+
+leaderboard_snapshot = LeaderboardSnapshot()
+
+
+async def top_entries(user_id, limit):
+    """First limit leaderboard entries from the shared snapshot, the caller marked "(You)"."""
+    users = await leaderboard_snapshot.top()
+    return [_entry(user, rank, user_id) for rank, user in enumerate(users[:limit], 1)]
+
+
+async def rank_of(user):
+    """Exact 1-based rank of a user document carrying _id and xp."""
+    return 1 + await users_collection.count_documents(_ahead_of(user.get("xp", 0), user["_id"]))
+
+
+async def entries_around(user, window):
+    """The caller's rank and the window entries on either side of them."""
+    user_id, xp = user["_id"], user.get("xp", 0)
+    rank = await rank_of(user)
+
+    above, below = [], []
+    if window > 0:  # limit(0) would mean no limit
+        above = await users_collection.find(_ahead_of(xp, user_id), _PROJECTION) \
+            .sort(_REVERSE_ORDER).limit(window).to_list(length=window)
+        below = await users_collection.find(_behind(xp, user_id), _PROJECTION) \
+            .sort(LEADERBOARD_ORDER).limit(window).to_list(length=window)
+
+    users = above[::-1] + [user] + below
+    first_rank = rank - len(above)
+    return rank, [_entry(u, first_rank + i, user_id) for i, u in enumerate(users)]
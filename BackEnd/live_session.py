@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from flight_recorder import NULL_RECORDER
+
+logger = logging.getLogger(__name__)
+
+# Node-wide live-feed counters, served by /live-feed/stats.
+live_stats = {
+    "active_connections": 0,
+    "frames_received": 0,
+    "frames_processed": 0,
+    "frames_dropped": 0,
+    "decode_errors": 0,
+}
+
+
+class FrameMailbox:
+    """Holds only the newest unprocessed frame of a live-feed connection.
+
+    When analysis falls behind the client's frame rate, older frames are
+    dropped instead of queueing up and adding latency.
+    """
+
+    def __init__(self):
+        self.data = None
+        self.seq = 0          # Number of frames received, i.e. index of the newest one
+        self.dropped = 0
+        self.closed = False
+        self.recorder = NULL_RECORDER
+        self._ready = asyncio.Event()
+
+    def put(self, data):
+        if self.data is not None:
+            self.dropped += 1
+            live_stats["frames_dropped"] += 1
+            self.recorder.instant("drop", seq=self.seq)
+
+        self.data = data
+        self.seq += 1
+        live_stats["frames_received"] += 1
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        # Returns (data, seq) of the newest frame, or (None, seq) once closed.
+        while self.data is None and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+
+        data, self.data = self.data, None
+        return data, self.seq
+
+
+async def receive_frames(websocket, mailbox):
+    try:
+        while True:
+            mailbox.put(await websocket.receive_bytes())
+    finally:
+        mailbox.close()
+
+
+class SessionCheckpointer:
+    """Snapshots a live session's ProcessFrame into the session store whenever
+    its counters or rep state change, without blocking the frame loop."""
+
+    def __init__(self, store, token, process_frame):
+        self.store = store
+        self.token = token
+        self.process_frame = process_frame
+        self.key = None
+        self._pending = None
+
+    async def _save(self, snapshot):
+        try:
+            await self.store.save(self.token, snapshot)
+        except Exception as e:
+            logger.error(f"Failed to checkpoint live session: {e}")
+
+    def update(self):
+        state_tracker = self.process_frame.state_tracker
+        key = (state_tracker['SQUAT_COUNT'], state_tracker['IMPROPER_SQUAT'], tuple(state_tracker['state_seq']))
+        if key == self.key:
+            return
+
+        # One save in flight at a time; retry on a later frame.
+        if self._pending is not None and not self._pending.done():
+            return
+
+        self.key = key
+        self._pending = asyncio.ensure_future(self._save(self.process_frame.snapshot()))
+
+    async def flush(self):
+        if self._pending is not None:
+            await self._pending
+        await self._save(self.process_frame.snapshot())
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from bson import ObjectId
+from database import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rep events are buffered in memory and written with insert_many every
+# LIVE_EVENT_FLUSH_INTERVAL seconds (or sooner once LIVE_EVENT_BATCH_SIZE
+# events are waiting), never one write per frame or per rep.
+LIVE_EVENT_FLUSH_INTERVAL = float(os.getenv("LIVE_EVENT_FLUSH_INTERVAL", "5"))
+LIVE_EVENT_BATCH_SIZE = int(os.getenv("LIVE_EVENT_BATCH_SIZE", "500"))
+
+rep_events_collection = db.get_collection("rep_events")
+live_sessions_collection = db.get_collection("workout_sessions")
+
+
+class SessionSummary:
+    """Per-connection totals for the workout_sessions summary document."""
+
+    def __init__(self, session_id, user_id=None, difficulty="beginner"):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.difficulty = difficulty
+        self.started_at = datetime.utcnow()
+        self.frames = 0
+        self.correct = 0
+        self.improper = 0
+        self.faults = Counter()
+        self.peak_knee_angle = 0
+
+    def record(self, events):
+        for event in events:
+            if event["correct"]:
+                self.correct += 1
+            else:
+                self.improper += 1
+            self.faults.update(event["faults"])
+            self.peak_knee_angle = max(self.peak_knee_angle, event["peak_knee_angle"])
+
+
+class BatchWriter:
+    """Buffers documents in memory and writes them with insert_many from a
+    background task, so callers in the frame loop never await a write."""
+
+    def __init__(self, collection, interval=LIVE_EVENT_FLUSH_INTERVAL, batch_size=LIVE_EVENT_BATCH_SIZE):
+        self.collection = collection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.buffer = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def add_documents(self, documents):
+        self.buffer.extend(documents)
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+
+        batch, self.buffer = self.buffer, []
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} documents to {self.collection.name}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+class RepEventWriter(BatchWriter):
+
+    def add(self, summary, events):
+        # Called from the frame loop: only appends, never awaits.
+        self.add_documents([
+            {
+                "session_id": summary.session_id,
+                "user_id": summary.user_id,
+                "timestamp": datetime.utcfromtimestamp(event["timestamp"]),
+                "correct": event["correct"],
+                "faults": event["faults"],
+                "peak_knee_angle": event["peak_knee_angle"],
+                "peak_hip_angle": event["peak_hip_angle"],
+            }
+            for event in events
+        ])
+
+    async def close_session(self, summary):
+        """Flush pending events and upsert the session summary document."""
+        await self.flush()
+
+        update = {
+            "$set": {
+                "user_id": summary.user_id,
+                "difficulty": summary.difficulty,
+                "ended_at": datetime.utcnow(),
+            },
+            "$setOnInsert": {"started_at": summary.started_at},
+            "$inc": {
+                "frames": summary.frames,
+                "correct": summary.correct,
+                "improper": summary.improper,
+                **{f"faults.{name}": count for name, count in summary.faults.items()},
+            },
+            "$max": {"peak_knee_angle": summary.peak_knee_angle},
+        }
+        try:
+            # Keyed by session token, so a resumed session extends the same summary.
+            await live_sessions_collection.update_one({"_id": summary.session_id}, update, upsert=True)
+        except Exception as e:
+            logger.error(f"Failed to write session summary {summary.session_id}: {e}")
+
+
+rep_event_writer = RepEventWriter(rep_events_collection)
+
+
+def to_object_id(user_id):
+    return ObjectId(user_id) if user_id and ObjectId.is_valid(user_id) else None
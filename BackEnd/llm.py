@@ -0,0 +1,311 @@
+"""Shared LLM gateway for workout and meal generation.
+
+One configured client per process, called with the SDK's async API so a
+multi-second generation never blocks the event loop. Every call goes through
+a global concurrency limit, a per-attempt timeout, retries with full-jitter
+exponential backoff and a circuit breaker that fails fast while the backend
+is down. LLM_BACKEND=fake swaps in a local generator for offline testing and
+load tests.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from dotenv import load_dotenv
+from json_stream import IncrementalObjectParser
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "45"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_STREAM_DEADLINE = float(os.getenv("LLM_STREAM_DEADLINE", "120"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0.5"))
+
+GENERATION_CONFIG = {
+    "temperature": 1.0,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+}
+
+
+class LLMError(Exception):
+    """The model could not produce a usable response."""
+
+
+class LLMUnavailable(LLMError):
+    """The circuit is open or retries are exhausted; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after=LLM_BREAKER_RESET):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GeminiBackend:
+
+    def __init__(self, model_name=LLM_MODEL):
+        import google.generativeai as genai
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise LLMError("Gemini API key is not configured")
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt, kind):
+        response = await self.model.generate_content_async(prompt, generation_config=GENERATION_CONFIG)
+        return response.text
+
+    async def stream(self, prompt, kind):
+        response = await self.model.generate_content_async(prompt, generation_config=GENERATION_CONFIG, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+class FakeBackend:
+    """Offline stand-in: returns well-formed JSON for each kind after a delay."""
+
+    chunk_size = 24
+
+    def __init__(self, latency=LLM_FAKE_LATENCY):
+        self.latency = latency
+
+    def _render(self, prompt, kind):
+        rng = random.Random(hashlib.sha1(prompt.encode()).hexdigest())
+        if kind == "workout":
+            return json.dumps(self._workout(rng), indent=2)
+        if kind == "meal_day":
+            return json.dumps(self._meal_day(rng), indent=2)
+        raise LLMError(f"Fake backend has no response for kind {kind!r}")
+
+    async def generate(self, prompt, kind):
+        await asyncio.sleep(self.latency)
+        return self._render(prompt, kind)
+
+    async def stream(self, prompt, kind):
+        # Spread the same total latency over the chunks, like a token stream.
+        text = self._render(prompt, kind)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+    @staticmethod
+    def _workout(rng):
+        names = ["Goblet Squat", "Push-up", "Bent-over Row", "Walking Lunge", "Plank", "Glute Bridge", "Burpee"]
+        exercises = [
+            {
+                "name": name,
+                "sets": rng.randint(2, 4),
+                "reps": rng.choice(["8-10", "10-12", "12-15"]),
+                "weight": 0,
+                "duration": 0,
+                "description": f"Controlled {name.lower()} with full range of motion.",
+                "restTime": rng.choice([45, 60, 90]),
+                "xp": rng.randint(10, 30),
+            }
+            for name in rng.sample(names, 4)
+        ]
+        return {
+            "title": rng.choice(["Iron Foundations", "Tempo Builder", "Core Circuit", "Power Ladder"]),
+            "type": rng.choice(["strength", "cardio"]),
+            "duration": rng.choice([30, 40, 45]),
+            "intensity": rng.choice(["Low", "Medium", "High"]),
+            "description": "Generated offline by the fake LLM backend.",
+            "xp": sum(exercise["xp"] for exercise in exercises),
+            "exercises": exercises,
+        }
+
+    @staticmethod
+    def _meal_day(rng):
+        def meal(name):
+            return {"name": name, "calories": rng.randint(350, 750), "protein": rng.randint(20, 50),
+                    "carbs": rng.randint(30, 90), "fats": rng.randint(10, 30), "completed": False}
+
+        return {
+            "breakfast": [meal(rng.choice(["Oats with berries", "Egg scramble", "Greek yogurt bowl"]))],
+            "lunch": [meal(rng.choice(["Chicken rice bowl", "Lentil salad", "Tuna wrap"]))],
+            "dinner": [meal(rng.choice(["Salmon and greens", "Tofu stir-fry", "Beef chili"]))],
+        }
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures; after `reset` seconds one
+    trial call is let through and its outcome closes or reopens the circuit."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset=LLM_BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset or self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(1, round(self.reset - (time.monotonic() - self.opened_at)))
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """End a trial call that produced no outcome (cancelled or abandoned);
+        the circuit stays open and the next call becomes the trial."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._trial_in_flight or self.consecutive_failures >= self.failures:
+            if self.opened_at is None or self._trial_in_flight:
+                logger.warning(f"LLM circuit opened after {self.consecutive_failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+class LLMGateway:
+
+    def __init__(self, backend=None, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT, retries=LLM_RETRIES,
+                 stream_deadline=LLM_STREAM_DEADLINE):
+        self._backend = backend
+        self.timeout = timeout
+        self.stream_deadline = stream_deadline
+        self.retries = retries
+        self.breaker = CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @property
+    def backend(self):
+        # Created on first use so importing this module never needs credentials.
+        if self._backend is None:
+            self._backend = FakeBackend() if LLM_BACKEND == "fake" else GeminiBackend()
+        return self._backend
+
+    async def generate(self, prompt, kind):
+        """Return the model's text for prompt; kind names the expected response shape."""
+        backend = self.backend
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("LLM backend is unavailable", self.breaker.retry_after())
+            trial = self.breaker.opened_at is not None
+
+            try:
+                async with self._semaphore:
+                    text = await asyncio.wait_for(backend.generate(prompt, kind), timeout=self.timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = LLMError(f"LLM call timed out after {self.timeout}s")
+                last_error = e
+                self.breaker.record_failure()
+                logger.warning(f"LLM {kind} attempt {attempt + 1}/{self.retries + 1} failed: {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(random.uniform(0, LLM_BACKOFF * 2 ** attempt))
+                continue
+            except BaseException:
+                # Cancelled (e.g. the client went away): a trial left in flight would keep the circuit open.
+                if trial:
+                    self.breaker.release_trial()
+                raise
+
+            self.breaker.record_success()
+            return text
+
+        raise LLMUnavailable(f"LLM call failed after {self.retries + 1} attempts: {last_error}",
+                             self.breaker.retry_after() or LLM_BACKOFF)
+
+    async def stream(self, prompt, kind):
+        """Yield the model's text in chunks as it is generated. Failures before
+        the first chunk are retried like generate(); once text has been
+        yielded a failure raises LLMError, since the caller has consumed it.
+
+        Each open stream holds one concurrency slot from opening to close, so
+        LLM_CONCURRENCY bounds concurrent backend calls of every kind. Chunks
+        must arrive within timeout of each other and the whole stream within
+        stream_deadline, which also bounds how long a slow consumer can keep
+        the slot."""
+        backend = self.backend
+        loop = asyncio.get_running_loop()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("LLM backend is unavailable", self.breaker.retry_after())
+            trial = self.breaker.opened_at is not None
+
+            started = False
+            deadline = loop.time() + self.stream_deadline
+            try:
+                async with self._semaphore:
+                    chunks = backend.stream(prompt, kind)
+                    try:
+                        while True:
+                            remaining = deadline - loop.time()
+                            if remaining <= 0:
+                                raise asyncio.TimeoutError()
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=min(self.timeout, remaining))
+                            except StopAsyncIteration:
+                                break
+                            started = True
+                            yield chunk
+                    finally:
+                        await chunks.aclose()
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = LLMError(f"LLM stream stalled for {self.timeout}s" if loop.time() < deadline
+                                 else f"LLM stream exceeded its {self.stream_deadline}s deadline")
+                last_error = e
+                self.breaker.record_failure()
+                logger.warning(f"LLM {kind} stream attempt {attempt + 1}/{self.retries + 1} failed: {e}")
+                if started:
+                    raise LLMError(f"LLM stream interrupted: {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(random.uniform(0, LLM_BACKOFF * 2 ** attempt))
+                continue
+            except BaseException:
+                # Cancelled, or the consumer closed this generator early.
+                if trial:
+                    self.breaker.release_trial()
+                raise
+
+            self.breaker.record_success()
+            return
+
+        raise LLMUnavailable(f"LLM stream failed after {self.retries + 1} attempts: {last_error}",
+                             self.breaker.retry_after() or LLM_BACKOFF)
+
+    async def generate_json(self, prompt, kind):
+        """generate() parsed as one JSON object, the same way stream consumers
+        parse it: text around the object (such as code fences) is ignored."""
+        text = await self.generate(prompt, kind)
+        parser = IncrementalObjectParser()
+        try:
+            parser.feed(text)
+            return parser.close()
+        except ValueError as e:
+            logger.error("JSON parsing error: %s - Response: %s", str(e), text)
+            raise LLMError(f"Failed to parse AI response: {str(e)}")
+
+
+llm = LLMGateway()
@@ -0,0 +1,210 @@
+"""End-to-end load generator for the /live-feed WebSocket.
+
+Opens N concurrent connections, sends the difficulty handshake and streams
+pre-encoded JPEG frames of a scripted squat at a target fps. Reports response
+latency percentiles, achieved fps and frames the server dropped.
+
+Start the server with POSE_BACKEND=stub (or use --spawn-server stub) to
+measure the server's own overhead without the pose model cost.
+
+Usage: python loadtest.py --connections 20 --fps 15 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+import cv2
+import numpy as np
+import websockets
+from stub_pose import squat_keypoints, REP_FRAMES, REST_FRAMES
+
+BONES = [('shoulder', 'elbow'), ('elbow', 'wrist'), ('shoulder', 'hip'),
+         ('hip', 'knee'), ('knee', 'ankle'), ('ankle', 'foot')]
+
+
+def render_frames(width, height, quality=80):
+
+    # One JPEG per frame of the scripted squat, encoded once up front.
+    frames = []
+    for i in range(REP_FRAMES + REST_FRAMES):
+        image = np.full((height, width, 3), 90, dtype=np.uint8)
+        points = {k: (int(x * width), int(y * height)) for k, (x, y) in squat_keypoints(i).items()}
+
+        for a, b in BONES:
+            cv2.line(image, points[a], points[b], (230, 230, 230), 12, lineType=cv2.LINE_AA)
+        cv2.circle(image, points['nose'], 28, (200, 180, 160), -1, lineType=cv2.LINE_AA)
+
+        _, buffer = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        frames.append(buffer.tobytes())
+
+    return frames
+
+
+def percentile(values, pct):
+
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def fetch_stats(http_url):
+
+    with urllib.request.urlopen(http_url, timeout=5) as response:
+        return json.load(response)
+
+
+async def run_connection(url, frames, fps, duration, difficulty, drain_seconds):
+
+    loop = asyncio.get_running_loop()
+    sent_at = {}
+    result = {"sent": 0, "responses": 0, "dropped": 0, "latencies": [], "error": None}
+
+    # Spread connection start-up over one frame interval.
+    await asyncio.sleep(random.uniform(0, 1 / fps))
+
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(difficulty)
+            started = time.perf_counter()
+
+            async def receiver():
+                async for message in ws:
+                    if isinstance(message, str):
+                        info = json.loads(message)
+                        if "seq" not in info:
+                            continue
+                        sent = sent_at.pop(info["seq"], None)
+                        if sent is not None:
+                            result["latencies"].append(time.perf_counter() - sent)
+                        result["responses"] += 1
+                        result["dropped"] = info["dropped"]
+
+            receiving = asyncio.ensure_future(receiver())
+
+            next_send = loop.time()
+            end = next_send + duration
+            while loop.time() < end:
+                result["sent"] += 1
+                sent_at[result["sent"]] = time.perf_counter()
+                await ws.send(frames[result["sent"] % len(frames)])
+
+                next_send += 1 / fps
+                await asyncio.sleep(max(0.0, next_send - loop.time()))
+
+            # Let in-flight frames come back before closing.
+            await asyncio.sleep(drain_seconds)
+            result["elapsed"] = time.perf_counter() - started
+            await ws.close()
+            await asyncio.gather(receiving, return_exceptions=True)
+
+    except Exception as e:
+        result["error"] = repr(e)
+        result.setdefault("elapsed", duration)
+
+    return result
+
+
+def report(results, duration, server_before, server_after):
+
+    failed = [r for r in results if r["error"]]
+    ok = [r for r in results if not r["error"]]
+    latencies = [l * 1000 for r in ok for l in r["latencies"]]
+    fps = [r["responses"] / duration for r in ok]
+
+    print(f"\nconnections: {len(ok)} ok, {len(failed)} failed")
+    for r in failed[:5]:
+        print(f"  error: {r['error']}")
+
+    if ok:
+        print(f"frames sent: {sum(r['sent'] for r in ok)}, responses: {sum(r['responses'] for r in ok)}, "
+              f"dropped by server: {sum(r['dropped'] for r in ok)}")
+        print(f"achieved fps per connection: min {min(fps):.1f}  mean {sum(fps) / len(fps):.1f}  max {max(fps):.1f}")
+        print(f"latency ms: p50 {percentile(latencies, 50):.1f}  p90 {percentile(latencies, 90):.1f}  "
+              f"p99 {percentile(latencies, 99):.1f}  max {max(latencies, default=float('nan')):.1f}")
+
+        per_conn_p99 = [percentile([l * 1000 for l in r["latencies"]], 99) for r in ok]
+        print(f"per-connection p99 ms: best {min(per_conn_p99):.1f}  worst {max(per_conn_p99):.1f}")
+
+    if server_before and server_after:
+        delta = {k: server_after[k] - server_before[k] for k in server_before if k != "active_connections"}
+        print(f"server counters: {delta}")
+
+
+def spawn_server(backend, port):
+
+    env = dict(os.environ, POSE_BACKEND=backend)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+
+    for _ in range(100):
+        try:
+            fetch_stats(f"http://127.0.0.1:{port}/live-feed/stats")
+            return process
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def main_async(args):
+
+    frames = render_frames(args.width, args.height)
+    url = f"{args.url}?stats=1&analysis_width={args.width}"
+    stats_url = args.url.replace("ws://", "http://").replace("wss://", "https://") + "/stats"
+
+    try:
+        server_before = fetch_stats(stats_url)
+    except OSError:
+        server_before = None
+
+    print(f"{args.connections} connections x {args.fps} fps for {args.duration}s, "
+          f"{args.width}x{args.height} frames ({sum(map(len, frames)) // len(frames) // 1024} KiB avg)")
+
+    results = await asyncio.gather(*(
+        run_connection(url, frames, args.fps, args.duration, args.difficulty, args.drain)
+        for _ in range(args.connections)
+    ))
+
+    server_after = fetch_stats(stats_url) if server_before else None
+    report(results, args.duration, server_before, server_after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/live-feed")
+    parser.add_argument("-c", "--connections", type=int, default=10)
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--difficulty", default="beginner", choices=["beginner", "pro"])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for responses after sending")
+    parser.add_argument("--spawn-server", choices=["mediapipe", "stub"],
+                        help="start a local server with this pose backend on --port")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn_server:
+        server = spawn_server(args.spawn_server, args.port)
+        args.url = f"ws://127.0.0.1:{args.port}/live-feed"
+
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
 from pydantic import BaseModel
 from database import db  # Assuming this is your MongoDB connection (e.g., motor client)
 from bson import ObjectId
-import jwt
+from pymongo import ReturnDocument
+from auth import get_current_user
+from user_loader import current_user_doc
+from xp_ledger import award_xp
+from llm import llm, LLMError, LLMUnavailable
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
-import json
 import logging
 
 load_dotenv()
 
 router = APIRouter()
 
-# JWT setup
-JWT_SECRET = os.getenv("JWT_SECRET")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-ALGORITHM = "HS256"
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
-
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -45,43 +40,6 @@ class WeeklyMealPlan(BaseModel):
     week_start: str  # ISO format date string (e.g., "2025-03-23")
     days: List[DayPlan]
 
-# Dependency to get the current user from JWT
-async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
-    logger.debug(f"Raw Authorization header: {request.headers.get('Authorization')}")
-    logger.debug(f"Extracted token: {token}")
-    if not token:
-        logger.error("No token provided")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="No token provided",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            logger.error("Token payload missing user_id")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token: missing user_id",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        logger.debug(f"User ID from token: {user_id}")
-        return user_id
-    except jwt.InvalidTokenError as e:
-        logger.error(f"JWT decoding error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid token: {str(e)}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except Exception as e:
-        logger.error(f"Unexpected error in get_current_user: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Server error: {str(e)}",
-        )
-
 # Helper to get the current week's start date (Sunday)
 def get_week_start():
     today = datetime.utcnow()
@@ -96,7 +54,12 @@ def calculate_bmi(height_cm: float, weight_kg: float) -> float:
 
 # Generate a meal plan for the selected day only (new unambiguous path)
 @router.post("/mealplans/generate-day/{day_index}", response_description="Generate a meal plan for a specific day")
-async def generate_meal_plan_for_day(request: Request, day_index: int, user_id: str = Depends(get_current_user)):
+async def generate_meal_plan_for_day(
+    request: Request,
+    day_index: int,
+    user: dict = Depends(current_user_doc("height", "weight", "age", "gender", "activity_level", "goals", "preferences")),
+):
+    user_id = str(user["_id"])
     logger.info(f"Received request for generate-day - URL: {request.url}, day_index: {day_index}, user_id: {user_id}")
     if day_index < 0 or day_index > 6:
         logger.error(f"Invalid day_index: {day_index}")
@@ -105,11 +68,6 @@ async def generate_meal_plan_for_day(request: Request, day_index: int, user_id:
     week_start = get_week_start()
     logger.debug(f"Week start: {week_start}")
 
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        logger.error(f"User not found: {user_id}")
-        raise HTTPException(status_code=404, detail="User not found")
-
     height_cm = user.get("height", 170)
     weight_kg = user.get("weight", 70)
     age = user.get("age", 30)
@@ -125,12 +83,6 @@ async def generate_meal_plan_for_day(request: Request, day_index: int, user_id:
     logger.debug(f"Calculated BMI: {bmi}")
 
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        if not GEMINI_API_KEY:
-            logger.error("Gemini API key is missing")
-            raise HTTPException(status_code=500, detail="Gemini API key is not configured")
-
-        model = genai.GenerativeModel("gemini-1.5-flash")
         logger.debug("User details: height=%s cm, weight=%s kg, age=%s years, gender=%s, activity=%s, goals=%s, preferences=%s",
                      height_cm, weight_kg, age, gender, activity_level, goals, preferences)
 
@@ -157,81 +109,58 @@ async def generate_meal_plan_for_day(request: Request, day_index: int, user_id:
             "}"
         )
 
-        logger.info("Sending prompt to Gemini API for day %s", day_index)
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 1.0,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-            }
-        )
-        raw_response = response.text.strip()
-        logger.debug("Raw response from Gemini: %s", raw_response)
-
-        cleaned_response = raw_response.replace("```json", "").replace("```", "").strip()
-        logger.debug("Cleaned response: %s", cleaned_response)
-
-        day_meals = json.loads(cleaned_response)
+        logger.info("Sending meal plan prompt to LLM for day %s", day_index)
+        day_meals = await llm.generate_json(prompt, kind="meal_day")
         logger.info("Successfully parsed JSON response for day %s", day_index)
 
-        meal_plan = await db.mealplans.find_one({"user_id": user_id, "week_start": week_start})
-        if not meal_plan:
-            logger.debug("No existing meal plan found, creating new one")
-            meal_plan = {
-                "user_id": user_id,
-                "week_start": week_start,
-                "days": [{"breakfast": [], "lunch": [], "dinner": []}] * 7
-            }
-            meal_plan["days"][day_index] = day_meals
-            await db.mealplans.insert_one(meal_plan)
-        else:
-            logger.debug("Updating existing meal plan")
-            meal_plan["days"][day_index] = day_meals
-            await db.mealplans.update_one(
-                {"user_id": user_id, "week_start": week_start},
-                {"$set": {"days": meal_plan["days"]}}
-            )
+        # Upsert an empty week first so concurrent first requests don't race on the unique index
+        plan_filter = {"user_id": user_id, "week_start": week_start}
+        await db.mealplans.update_one(
+            plan_filter,
+            {"$setOnInsert": {"days": [{"breakfast": [], "lunch": [], "dinner": []}] * 7}},
+            upsert=True
+        )
+        await db.mealplans.update_one(plan_filter, {"$set": {f"days.{day_index}": day_meals}})
 
         logger.info("Meal plan updated successfully for day %s, user_id: %s", day_index, user_id)
         return {"message": f"Meal plan generated successfully for day {day_index}"}
 
-    except json.JSONDecodeError as e:
-        logger.error("JSON parsing error: %s - Cleaned Response: %s", str(e), cleaned_response)
-        raise HTTPException(status_code=500, detail=f"Failed to parse AI-generated meal plan: {str(e)}")
+    except LLMUnavailable as e:
+        logger.error("LLM unavailable: %s", str(e))
+        raise HTTPException(status_code=503, detail="Meal plan generation is temporarily unavailable",
+                            headers={"Retry-After": str(int(e.retry_after) or 1)})
+    except LLMError as e:
+        logger.error("LLM error: %s", str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to generate meal plan: {str(e)}")
     except Exception as e:
         logger.error("Unexpected error in generate_meal_plan_for_day: %s", str(e))
         raise HTTPException(status_code=500, detail=f"Error generating meal plan: {str(e)}")
 
 # Fetch user details (including XP)
 @router.get("/users/me")
-async def get_user(user_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def get_user(user: dict = Depends(current_user_doc("xp"))):
     return {"xp": user.get("xp", 0)}
 
 # Get or create a weekly meal plan for the user
 @router.get("/mealplans", response_model=List[DayPlan])
 async def get_meal_plan(user_id: str = Depends(get_current_user)):
     week_start = get_week_start()
-    meal_plan = await db.mealplans.find_one({"user_id": user_id, "week_start": week_start})
-
-    if not meal_plan:
-        new_meal_plan = {
-            "user_id": user_id,
-            "week_start": week_start,
-            "days": [
-                {
-                    "breakfast": [{"name": "Protein Oatmeal", "calories": 450, "protein": 30, "carbs": 60, "fats": 12, "completed": False}],
-                    "lunch": [{"name": "Chicken Salad", "calories": 550, "protein": 40, "carbs": 35, "fats": 25, "completed": False}],
-                    "dinner": [{"name": "Salmon Bowl", "calories": 600, "protein": 45, "carbs": 50, "fats": 28, "completed": False}]
-                }
-            ] * 7  # 7 days from Sunday to Saturday
+    default_days = [
+        {
+            "breakfast": [{"name": "Protein Oatmeal", "calories": 450, "protein": 30, "carbs": 60, "fats": 12, "completed": False}],
+            "lunch": [{"name": "Chicken Salad", "calories": 550, "protein": 40, "carbs": 35, "fats": 25, "completed": False}],
+            "dinner": [{"name": "Salmon Bowl", "calories": 600, "protein": 45, "carbs": 50, "fats": 28, "completed": False}]
         }
-        await db.mealplans.insert_one(new_meal_plan)
-        meal_plan = new_meal_plan
+    ] * 7  # 7 days from Sunday to Saturday
+
+    # Get-or-create in one atomic upsert; the (user_id, week_start) index is unique
+    meal_plan = await db.mealplans.find_one_and_update(
+        {"user_id": user_id, "week_start": week_start},
+        {"$setOnInsert": {"days": default_days}},
+        projection={"days": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
 
     return meal_plan["days"]
 
@@ -284,10 +213,7 @@ async def update_meal(day_index: int, meal_type: str, meal_index: int, meal: Mea
     )
 
     if not was_completed and is_completed:
-        await db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$inc": {"xp": 50}}
-        )
+        await award_xp(user_id, 50, "meal")
         logger.info(f"XP incremented by 50 for user_id: {user_id}")
 
     return {"message": "Meal updated successfully"}
@@ -0,0 +1,60 @@
+"""One-time migration: move users[].feedback arrays into the feedback collection.
+
+Each user's array is copied into the feedback collection and then unset on
+the user document. Copied documents carry migrated=True, and a user's earlier
+migrated copies are replaced before inserting, so an interrupted run can be
+restarted safely.
+
+    python migrate_feedback.py [--dry-run]
+"""
+import sys
+import asyncio
+import logging
+from datetime import datetime
+from database import users_collection
+from settings import feedback_collection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _submitted_at(entry):
+    value = entry.get("submitted_at")
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+
+async def migrate(dry_run=False):
+    users = migrated = 0
+    cursor = users_collection.find({"feedback": {"$exists": True}}, {"feedback": 1})
+    async for user in cursor:
+        documents = [
+            {
+                "user_id": user["_id"],
+                "feedback_type": entry.get("feedback_type", "general"),
+                "rating": entry.get("rating"),
+                "feedback_given": entry.get("feedback_given", ""),
+                "submitted_at": _submitted_at(entry),
+                "migrated": True,
+            }
+            for entry in user.get("feedback") or []
+        ]
+        users += 1
+        migrated += len(documents)
+        if dry_run:
+            continue
+
+        await feedback_collection.delete_many({"user_id": user["_id"], "migrated": True})
+        if documents:
+            await feedback_collection.insert_many(documents, ordered=False)
+        await users_collection.update_one({"_id": user["_id"]}, {"$unset": {"feedback": ""}})
+
+    logger.info(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} feedback entries from {users} users")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate(dry_run="--dry-run" in sys.argv))
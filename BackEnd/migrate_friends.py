@@ -0,0 +1,25 @@
+"""One-time migration: convert users[].friends from string ids to ObjectIds.
+
+Runs as a single server-side pipeline update; already-converted ids pass
+through unchanged, so it is safe to re-run.
+
+    python migrate_friends.py
+"""
+import asyncio
+import logging
+from database import users_collection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def migrate():
+    result = await users_collection.update_many(
+        {"friends": {"$type": "string"}},
+        [{"$set": {"friends": {"$map": {"input": "$friends", "in": {"$toObjectId": "$$this"}}}}}],
+    )
+    logger.info(f"Converted friend ids on {result.modified_count} users")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId
+from database import db, users_collection
+from workout_cache import profile_fingerprint
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Completing a workout queues generation of the user's next plan, stored in
+# pending_workouts (one document per user) until /generate-workout claims it.
+NEXT_WORKOUT_WORKERS = int(os.getenv("NEXT_WORKOUT_WORKERS", "2"))
+NEXT_WORKOUT_QUEUE = int(os.getenv("NEXT_WORKOUT_QUEUE", "1000"))
+NEXT_WORKOUT_MIN_INTERVAL = float(os.getenv("NEXT_WORKOUT_MIN_INTERVAL", "300"))
+NEXT_WORKOUT_TTL = float(os.getenv("NEXT_WORKOUT_TTL", str(7 * 24 * 3600)))
+
+pending_workouts_collection = db.get_collection("pending_workouts")
+
+
+class NextWorkoutQueue:
+    """Deduplicated, per-user rate-limited background generation jobs.
+
+    generate is an async callable taking an onboarding dict and returning a
+    validated Workout.
+    """
+
+    def __init__(self, generate, workers=NEXT_WORKOUT_WORKERS, min_interval=NEXT_WORKOUT_MIN_INTERVAL):
+        self.generate = generate
+        self.workers = workers
+        self.min_interval = min_interval
+        self._queue = asyncio.Queue(maxsize=NEXT_WORKOUT_QUEUE)
+        self._queued = set()
+        self._last_started = {}  # user_id -> monotonic time of the last job
+        self._tasks = []
+
+    def enqueue(self, user_id: str) -> bool:
+        now = time.monotonic()
+        if user_id in self._queued or now - self._last_started.get(user_id, -self.min_interval) < self.min_interval:
+            return False
+        try:
+            self._queue.put_nowait(user_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Next-workout queue full, skipping user {user_id}")
+            return False
+        self._queued.add(user_id)
+        return True
+
+    async def _run_job(self, user_id):
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"onboarding": 1})
+        if not user or "onboarding" not in user:
+            return
+
+        workout = await self.generate(user["onboarding"])
+        now = datetime.utcnow()
+        await pending_workouts_collection.replace_one(
+            {"_id": ObjectId(user_id)},
+            {
+                "workout": workout.dict(),
+                "fingerprint": profile_fingerprint(user["onboarding"]),
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=NEXT_WORKOUT_TTL),
+            },
+            upsert=True,
+        )
+        logger.info(f"Pre-generated next workout for user {user_id}")
+
+    async def _worker(self):
+        while True:
+            user_id = await self._queue.get()
+            self._queued.discard(user_id)
+            self._last_started[user_id] = time.monotonic()
+            try:
+                await self._run_job(user_id)
+            except Exception as e:
+                logger.warning(f"Next-workout generation failed for user {user_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+            if len(self._last_started) > NEXT_WORKOUT_QUEUE * 10:
+                cutoff = time.monotonic() - self.min_interval
+                self._last_started = {k: t for k, t in self._last_started.items() if t > cutoff}
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def claim_next_workout(user_id: str, onboarding: dict):
+    """Atomically take the user's pending plan, or None if there is none or
+    it was generated for a different onboarding profile."""
+    pending = await pending_workouts_collection.find_one_and_delete(
+        {"_id": ObjectId(user_id), "expires_at": {"$gt": datetime.utcnow()}}
+    )
+    if pending is None or pending.get("fingerprint") != profile_fingerprint(onboarding):
+        return None
+    return pending["workout"]
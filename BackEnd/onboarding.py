@@ -1,10 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from typing import Optional
 from database import users_collection
-import jwt as pyjwt
-import os
+from auth import get_current_user, get_existing_user
+from user_loader import current_user_doc
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from bson import ObjectId  # Import this at the top
@@ -14,9 +13,6 @@ load_dotenv()
 
 onboarding_router = APIRouter()
 
-JWT_SECRET = os.getenv("JWT_SECRET")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-
 # Onboarding Data Model (Updated for UserDetails)
 class UserDetailsData(BaseModel):
     fullName: str
@@ -50,35 +46,18 @@ class ScheduleData(BaseModel):
 class GoalsData(BaseModel):
     goals: List[str] 
 
-# Helper function to decode JWT token
-def decode_jwt(token: str):
-    try:
-        payload = pyjwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        return payload
-    except pyjwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except pyjwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-# Dependency to verify JWT token
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_jwt(token)
-    user_id = payload.get("user_id")
-
-    # Convert user_id to ObjectId for MongoDB query
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+# Dependency: the user's onboarding data (only the get-* routes need a DB read;
+# save-* routes just use the id from the token)
+get_onboarding_user = current_user_doc("onboarding")
 # Save User Details (Updated for Full Name, Date of Birth, and Gender)
 @onboarding_router.post("/save-user-details")
 async def save_user_details(
     data: UserDetailsData,
-    user: dict = Depends(get_current_user)  # Ensure the user is authenticated
+    user_id: str = Depends(get_current_user)  # Ensure the user is authenticated
 ):
     # Update the user's document, storing under "onboarding"
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.userDetails": data.dict()}}  # ✅ Store under "onboarding"
     )
 
@@ -91,7 +70,7 @@ async def save_user_details(
 # Get User Details
 @onboarding_router.get("/get-user-details")
 async def get_user_details(
-    user: dict = Depends(get_current_user)  # Ensure the user is authenticated
+    user: dict = Depends(get_onboarding_user)  # Ensure the user is authenticated
 ):
     # Fetch user details from "onboarding"
     if "onboarding" in user and "userDetails" in user["onboarding"]:
@@ -103,11 +82,11 @@ async def get_user_details(
 @onboarding_router.post("/save-fitness-profile")
 async def save_fitness_profile(
     data: FitnessProfileData,
-    user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_current_user)
 ):
     # Store under "onboarding.fitnessProfile"
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.fitnessProfile": data.dict()}}
     )
 
@@ -119,7 +98,7 @@ async def save_fitness_profile(
 # Get Fitness Profile Choice
 @onboarding_router.get("/get-fitness-profile")
 async def get_fitness_profile(
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_onboarding_user)
 ):
     if "onboarding" in user and "fitnessProfile" in user["onboarding"]:
         return user["onboarding"]["fitnessProfile"]
@@ -130,7 +109,7 @@ async def get_fitness_profile(
 @onboarding_router.post("/save-body-metrics")
 async def save_body_metrics(
     data: BodyMetricsData,
-    user: dict = Depends(get_current_user)  # Ensure the user is authenticated
+    user_id: str = Depends(get_current_user)  # Ensure the user is authenticated
 ):
     # Calculate BMI if not provided
     if data.bmi is None:
@@ -142,7 +121,7 @@ async def save_body_metrics(
 
     # Update user's body metrics inside "onboarding"
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.bodyMetrics": data.dict()}}  # ✅ Store inside onboarding
     )
 
@@ -155,7 +134,7 @@ async def save_body_metrics(
 # Get Body Metrics
 @onboarding_router.get("/get-body-metrics")
 async def get_body_metrics(
-    user: dict = Depends(get_current_user)  # Ensure the user is authenticated
+    user: dict = Depends(get_onboarding_user)  # Ensure the user is authenticated
 ):
     if "onboarding" in user and "bodyMetrics" in user["onboarding"]:
         return user["onboarding"]["bodyMetrics"]
@@ -165,9 +144,9 @@ async def get_body_metrics(
     
 # Save Experience Level
 @onboarding_router.post("/save-experience")
-async def save_experience(data: ExperienceData, user: dict = Depends(get_current_user)):
+async def save_experience(data: ExperienceData, user_id: str = Depends(get_existing_user)):
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.experience": data.experience}},  # ✅ Store in "onboarding"
         upsert=True
     )
@@ -179,18 +158,18 @@ async def save_experience(data: ExperienceData, user: dict = Depends(get_current
 
 # Get Experience Level
 @onboarding_router.get("/get-experience")
-async def get_experience(user: dict = Depends(get_current_user)):
+async def get_experience(user: dict = Depends(get_onboarding_user)):
     return {"experience": user.get("onboarding", {}).get("experience", None)}
 
 # Save Assistance Level
 @onboarding_router.post("/save-assistance")
 async def save_assistance(
     data: AssistanceData,
-    user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_current_user)
 ):
     # Store assistance level under "onboarding.assistance"
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.assistance": data.assistance}}
     )
 
@@ -201,7 +180,7 @@ async def save_assistance(
 
 # Get Assistance Level
 @onboarding_router.get("/get-assistance")
-async def get_assistance(user: dict = Depends(get_current_user)):
+async def get_assistance(user: dict = Depends(get_onboarding_user)):
     if "onboarding" in user and "assistance" in user["onboarding"]:
         return {"assistance": user["onboarding"]["assistance"]}
     else:
@@ -211,11 +190,11 @@ async def get_assistance(user: dict = Depends(get_current_user)):
 @onboarding_router.post("/save-schedule")
 async def save_schedule(
     data: ScheduleData,
-    user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_current_user)
 ):
     # Store under "onboarding.schedule"
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.schedule": data.dict()}}
     )
 
@@ -227,7 +206,7 @@ async def save_schedule(
 
 # Get Schedule
 @onboarding_router.get("/get-schedule")
-async def get_schedule(user: dict = Depends(get_current_user)):
+async def get_schedule(user: dict = Depends(get_onboarding_user)):
     if "onboarding" in user and "schedule" in user["onboarding"]:
         return user["onboarding"]["schedule"]
     else:
@@ -237,10 +216,10 @@ async def get_schedule(user: dict = Depends(get_current_user)):
 @onboarding_router.post("/save-goals")
 async def save_goals(
     data: GoalsData,
-    user: dict = Depends(get_current_user)
+    user_id: str = Depends(get_existing_user)  # Upserts, so check the user exists
 ):
     result = await users_collection.update_one(
-        {"_id": user["_id"]},
+        {"_id": ObjectId(user_id)},
         {"$set": {"onboarding.goals": data.goals}},
         upsert=True  # ✅ Ensure insertion if the user doesn't have goals yet
     )
@@ -250,7 +229,7 @@ async def save_goals(
 
 # Get Fitness Goals
 @onboarding_router.get("/get-goals")
-async def get_goals(user: dict = Depends(get_current_user)):
+async def get_goals(user: dict = Depends(get_onboarding_user)):
     if "onboarding" in user and "goals" in user["onboarding"]:
         return {"goals": user["onboarding"]["goals"]}
     else:
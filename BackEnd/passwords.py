@@ -0,0 +1,53 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from fastapi import HTTPException, status
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# bcrypt runs on a dedicated, bounded thread pool (bcrypt releases the GIL),
+# so hashing never stalls the event loop. Once PASSWORD_HASH_QUEUE calls are
+# running or waiting, new ones are rejected with 503 + Retry-After.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_RETRY_AFTER = os.getenv("PASSWORD_RETRY_AFTER", "1")
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_QUEUE:
+        logger.warning(f"Password hashing saturated ({_pending} pending), rejecting request")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": PASSWORD_RETRY_AFTER},
+        )
+
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+
+
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(_check, password, hashed)
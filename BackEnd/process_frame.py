@@ -1,15 +1,25 @@
 import time
 import cv2
 import numpy as np
-from utils import find_angle, get_landmark_features, draw_text, draw_dotted_line
+from flight_recorder import NULL_RECORDER
+from utils import find_angle, get_landmark_features, draw_text, draw_dotted_line, get_frame_signature, frame_difference
 
 
 class ProcessFrame:
-    def __init__(self, thresholds, flip_frame = False):
+    def __init__(self, thresholds, flip_frame = False, frame_diff_thresh = 2.0, max_reused_frames = 30):
         
         # Set if frame should be flipped or not.
         self.flip_frame = flip_frame
 
+        # Duplicate-frame gating: when a frame barely differs from the last one
+        # sent through the pose model, its landmarks are reused instead.
+        # A frame_diff_thresh of 0 disables gating.
+        self.frame_diff_thresh = frame_diff_thresh
+        self.max_reused_frames = max_reused_frames
+        self.prev_signature = None
+        self.prev_keypoints = None
+        self.reused_frames = 0
+
         # self.thresholds
         self.thresholds = thresholds
 
@@ -85,9 +95,23 @@ class ProcessFrame:
             'curr_state':None,
 
             'SQUAT_COUNT': 0,
-            'IMPROPER_SQUAT':0
+            'IMPROPER_SQUAT':0,
+
+            # Peak vertical angles and feedback ids of the rep in progress.
+            'REP_PEAK_KNEE': 0,
+            'REP_PEAK_HIP': 0,
+            'REP_FAULTS': []
             
         }
+
+        # Completed reps since the last drain_rep_events() call.
+        self.rep_events = []
+
+        # (hip, knee, ankle) vertical angles of the last frame, None if not measured.
+        self.latest_angles = None
+
+        # Stage timings for the session flight recorder (no-op unless enabled).
+        self.recorder = NULL_RECORDER
         
         self.FEEDBACK_ID_MAP = {
                                 0: ('BEND BACKWARDS', 215, (0, 153, 255)),
@@ -99,6 +123,71 @@ class ProcessFrame:
         
 
 
+    def snapshot(self):
+
+        # Compact, JSON-serializable copy of the counters and rep state, used
+        # to resume a live session on reconnect (possibly in another worker).
+        # Inactivity is stored as elapsed time since perf_counter is per process.
+        return {
+            'state_seq': list(self.state_tracker['state_seq']),
+            'INACTIVE_TIME': self.state_tracker['INACTIVE_TIME'],
+            'INACTIVE_TIME_FRONT': self.state_tracker['INACTIVE_TIME_FRONT'],
+            'DISPLAY_TEXT': self.state_tracker['DISPLAY_TEXT'].tolist(),
+            'COUNT_FRAMES': self.state_tracker['COUNT_FRAMES'].tolist(),
+            'LOWER_HIPS': bool(self.state_tracker['LOWER_HIPS']),
+            'INCORRECT_POSTURE': bool(self.state_tracker['INCORRECT_POSTURE']),
+            'prev_state': self.state_tracker['prev_state'],
+            'curr_state': self.state_tracker['curr_state'],
+            'SQUAT_COUNT': self.state_tracker['SQUAT_COUNT'],
+            'IMPROPER_SQUAT': self.state_tracker['IMPROPER_SQUAT'],
+            'REP_PEAK_KNEE': self.state_tracker['REP_PEAK_KNEE'],
+            'REP_PEAK_HIP': self.state_tracker['REP_PEAK_HIP'],
+            'REP_FAULTS': list(self.state_tracker['REP_FAULTS']),
+        }
+
+
+
+    def restore(self, snapshot):
+
+        self.state_tracker.update(snapshot)
+        self.state_tracker['state_seq'] = list(snapshot['state_seq'])
+        self.state_tracker['REP_FAULTS'] = list(snapshot['REP_FAULTS'])
+        self.state_tracker['DISPLAY_TEXT'] = np.array(snapshot['DISPLAY_TEXT'], dtype=bool)
+        self.state_tracker['COUNT_FRAMES'] = np.array(snapshot['COUNT_FRAMES'], dtype=np.int64)
+
+        # Time spent disconnected does not count as inactivity.
+        self.state_tracker['start_inactive_time'] = time.perf_counter()
+        self.state_tracker['start_inactive_time_front'] = time.perf_counter()
+
+
+
+    def drain_rep_events(self):
+
+        events, self.rep_events = self.rep_events, []
+        return events
+
+
+
+    def _flag_feedback(self, idx):
+
+        self.state_tracker['DISPLAY_TEXT'][idx] = True
+        if idx not in self.state_tracker['REP_FAULTS']:
+            self.state_tracker['REP_FAULTS'].append(idx)
+
+
+
+    def _record_rep(self, correct):
+
+        self.rep_events.append({
+            'timestamp': time.time(),
+            'correct': correct,
+            'faults': [self.FEEDBACK_ID_MAP[idx][0] for idx in sorted(self.state_tracker['REP_FAULTS'])],
+            'peak_knee_angle': self.state_tracker['REP_PEAK_KNEE'],
+            'peak_hip_angle': self.state_tracker['REP_PEAK_HIP'],
+        })
+
+
+
     def _get_state(self, knee_angle):
         
         knee = None        
@@ -157,14 +246,45 @@ class ProcessFrame:
 
 
 
+    def _detect_keypoints(self, frame, pose):
+
+        if self.frame_diff_thresh <= 0:
+            return pose.process(frame)
+
+        signature = get_frame_signature(frame)
+
+        # Reuse the previous landmarks for static frames, but refresh them
+        # periodically so the tracker never goes stale.
+        if self.prev_keypoints is not None and \
+           self.prev_signature.shape == signature.shape and \
+           self.reused_frames < self.max_reused_frames and \
+           frame_difference(signature, self.prev_signature) < self.frame_diff_thresh:
+                self.reused_frames += 1
+                return self.prev_keypoints
+
+        keypoints = pose.process(frame)
+
+        self.prev_signature = signature
+        self.prev_keypoints = keypoints
+        self.reused_frames = 0
+
+        return keypoints
+
+
+
     def process(self, frame: np.array, pose):
         play_sound = None
+        self.latest_angles = None
        
 
         frame_height, frame_width, _ = frame.shape
 
-        # Process the image.
-        keypoints = pose.process(frame)
+        # Process the image (static frames reuse the last landmarks, the
+        # analysis below still runs so inactivity timers keep advancing).
+        inference_start = time.perf_counter()
+        keypoints = self._detect_keypoints(frame, pose)
+        self.recorder.complete('inference', inference_start, reused=self.reused_frames > 0)
+        analysis_start = time.perf_counter()
 
         if keypoints.pose_landmarks:
             ps_lm = keypoints.pose_landmarks
@@ -320,10 +440,13 @@ class ProcessFrame:
 
                 draw_dotted_line(frame, ankle_coord, start=ankle_coord[1]-50, end=ankle_coord[1]+20, line_color=self.COLORS['blue'])
 
+                self.latest_angles = (hip_vertical_angle, knee_vertical_angle, ankle_vertical_angle)
+
                 # ------------------------------------------------------------
         
                 
                 # Join landmarks.
+                draw_start = time.perf_counter()
                 cv2.line(frame, shldr_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
                 cv2.line(frame, wrist_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
                 cv2.line(frame, shldr_coord, hip_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
@@ -339,6 +462,7 @@ class ProcessFrame:
                 cv2.circle(frame, knee_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
                 cv2.circle(frame, ankle_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
                 cv2.circle(frame, foot_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+                self.recorder.complete('draw', draw_start, part='skeleton')
 
                 
 
@@ -355,18 +479,24 @@ class ProcessFrame:
                     if len(self.state_tracker['state_seq']) == 3 and not self.state_tracker['INCORRECT_POSTURE']:
                         self.state_tracker['SQUAT_COUNT']+=1
                         play_sound = str(self.state_tracker['SQUAT_COUNT'])
+                        self._record_rep(correct=True)
                         
                     elif 's2' in self.state_tracker['state_seq'] and len(self.state_tracker['state_seq'])==1:
                         self.state_tracker['IMPROPER_SQUAT']+=1
                         play_sound = 'incorrect'
+                        self._record_rep(correct=False)
 
                     elif self.state_tracker['INCORRECT_POSTURE']:
                         self.state_tracker['IMPROPER_SQUAT']+=1
                         play_sound = 'incorrect'
+                        self._record_rep(correct=False)
                         
                     
                     self.state_tracker['state_seq'] = []
                     self.state_tracker['INCORRECT_POSTURE'] = False
+                    self.state_tracker['REP_PEAK_KNEE'] = 0
+                    self.state_tracker['REP_PEAK_HIP'] = 0
+                    self.state_tracker['REP_FAULTS'] = []
 
 
                 # ----------------------------------------------------------------------------------------------------
@@ -377,13 +507,16 @@ class ProcessFrame:
                 # -------------------------------------- PERFORM FEEDBACK ACTIONS --------------------------------------
 
                 else:
+                    self.state_tracker['REP_PEAK_KNEE'] = max(self.state_tracker['REP_PEAK_KNEE'], knee_vertical_angle)
+                    self.state_tracker['REP_PEAK_HIP'] = max(self.state_tracker['REP_PEAK_HIP'], hip_vertical_angle)
+
                     if hip_vertical_angle > self.thresholds['HIP_THRESH'][1]:
-                        self.state_tracker['DISPLAY_TEXT'][0] = True
+                        self._flag_feedback(0)
                         
 
                     elif hip_vertical_angle < self.thresholds['HIP_THRESH'][0] and \
                          self.state_tracker['state_seq'].count('s2')==1:
-                            self.state_tracker['DISPLAY_TEXT'][1] = True
+                            self._flag_feedback(1)
                         
                                         
                     
@@ -393,12 +526,12 @@ class ProcessFrame:
 
 
                     elif knee_vertical_angle > self.thresholds['KNEE_THRESH'][2]:
-                        self.state_tracker['DISPLAY_TEXT'][3] = True
+                        self._flag_feedback(3)
                         self.state_tracker['INCORRECT_POSTURE'] = True
 
                     
                     if (ankle_vertical_angle > self.thresholds['ANKLE_THRESH']):
-                        self.state_tracker['DISPLAY_TEXT'][2] = True
+                        self._flag_feedback(2)
                         self.state_tracker['INCORRECT_POSTURE'] = True
 
 
@@ -449,6 +582,7 @@ class ProcessFrame:
 
                 self.state_tracker['COUNT_FRAMES'][self.state_tracker['DISPLAY_TEXT']]+=1
 
+                draw_start = time.perf_counter()
                 frame = self._show_feedback(frame, self.state_tracker['COUNT_FRAMES'], self.FEEDBACK_ID_MAP, self.state_tracker['LOWER_HIPS'])
 
 
@@ -484,6 +618,7 @@ class ProcessFrame:
                     text_color_bg=(221, 0, 0),
                     
                 )  
+                self.recorder.complete('draw', draw_start, part='hud')
                 
                 
                 self.state_tracker['DISPLAY_TEXT'][self.state_tracker['COUNT_FRAMES'] > self.thresholds['CNT_FRAME_THRESH']] = False
@@ -549,4 +684,6 @@ class ProcessFrame:
             
             
             
+        self.recorder.complete('analysis', analysis_start)
+
         return frame, play_sound          
@@ -1,4 +1,7 @@
 import os
+import json
+import asyncio
+import time
 import cv2
 import av
 import shutil
@@ -6,18 +9,29 @@ import numpy as np
 import uvicorn
 import atexit
 from pathlib import Path
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Query, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from aiortc.contrib.media import MediaRecorder
 from dashboard import dashboard_router
 from utils import get_mediapipe_pose
+from stub_pose import StubPose, session_pose
 from process_frame import ProcessFrame
-from thresholds import get_thresholds_beginner, get_thresholds_pro
+from frame_codec import FrameCodec, LIVE_ANALYSIS_WIDTH
+from live_session import FrameMailbox, SessionCheckpointer, receive_frames, live_stats
+from session_store import session_store, new_session_token
+from live_workouts import SessionSummary, rep_event_writer, to_object_id
+from flight_recorder import get_flight_recorder, flight_recorders
+from angle_series import AngleSeriesRecorder, angle_chunk_writer, angle_series_router
+from indexes import ensure_indexes
+from xp_ledger import xp_ledger_writer, xp_rollup
+from thresholds import get_thresholds
 from onboarding import onboarding_router
 from auth_routes import auth_router
-from workout import workout_router
+from auth import user_id_from_token
+from workout import workout_router, next_workout_queue
 from mealprep import router as mealprep_router
 from settings import router as settings_router
+from webrtc_routes import webrtc_router, close_peer_connections
 
 app = FastAPI()
 
@@ -31,15 +45,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Function to get difficulty thresholds
-def get_thresholds(difficulty: str):
-    return get_thresholds_pro() if difficulty == "pro" else get_thresholds_beginner()
-
-# Initialize Pose Detection
-pose = get_mediapipe_pose()
+# Initialize Pose Detection (POSE_BACKEND=stub replays a scripted squat for load tests)
+pose = StubPose() if os.getenv("POSE_BACKEND") == "stub" else get_mediapipe_pose()
+app.state.pose = pose
 
 @app.websocket("/live-feed")
-async def live_feed(websocket: WebSocket):
+async def live_feed(
+    websocket: WebSocket,
+    analysis_width: int = Query(LIVE_ANALYSIS_WIDTH, ge=160, le=1920),
+    stats: bool = Query(False),
+    session: str = Query(None),
+    token: str = Query(None),
+    trace: bool = Query(False),
+):
     """ Live WebSocket feed for real-time AI fitness tracking """
     await websocket.accept()
     print("WebSocket Connected!")
@@ -52,19 +70,75 @@ async def live_feed(websocket: WebSocket):
         
         thresholds = get_thresholds(difficulty)
         live_process_frame = ProcessFrame(thresholds=thresholds, flip_frame=True)
+        live_pose = session_pose(pose)
+        codec = FrameCodec(analysis_width=analysis_width)
+
+        # Resume counters from a dropped connection within the grace window.
+        snapshot = await session_store.load(session) if session else None
+        if snapshot is not None:
+            live_process_frame.restore(snapshot)
+        session_token = session if snapshot is not None else new_session_token()
+        await websocket.send_text(json.dumps({"session": session_token, "resumed": snapshot is not None}))
+        checkpointer = SessionCheckpointer(session_store, session_token, live_process_frame)
+
+        # Rep events are buffered and written in batches in the background.
+        summary = SessionSummary(session_token, to_object_id(user_id_from_token(token)), difficulty)
+        angle_recorder = AngleSeriesRecorder(session_token, summary.user_id)
+
+        # Opt-in per-stage timeline, dumped via /live-feed/trace/{session}.
+        recorder = get_flight_recorder(session_token, trace)
+        live_process_frame.recorder = recorder
+
+        # Frames are received in the background; only the newest one is analysed.
+        mailbox = FrameMailbox()
+        mailbox.recorder = recorder
+        receiver = asyncio.create_task(receive_frames(websocket, mailbox))
+        live_stats["active_connections"] += 1
 
-        while True:
-            data = await websocket.receive_bytes()
-            nparr = np.frombuffer(data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if frame is None:
-                continue
-
-            processed_frame, feedback = live_process_frame.process(frame, pose)
-
-            _, buffer = cv2.imencode(".jpg", processed_frame)
-            await websocket.send_bytes(buffer.tobytes())
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                data, seq = await mailbox.get()
+                recorder.complete("queue_wait", wait_start)
+                if data is None:
+                    break
+
+                with recorder.span("decode", seq=seq):
+                    frame = codec.decode(data)
+
+                if frame is None:
+                    live_stats["decode_errors"] += 1
+                    continue
+
+                with recorder.span("process", seq=seq):
+                    processed_frame, feedback = live_process_frame.process(frame, live_pose)
+                live_stats["frames_processed"] += 1
+                summary.frames += 1
+                angle_recorder.add(live_process_frame.latest_angles)
+                checkpointer.update()
+
+                rep_events = live_process_frame.drain_rep_events()
+                if rep_events:
+                    summary.record(rep_events)
+                    rep_event_writer.add(summary, rep_events)
+
+                with recorder.span("encode", seq=seq):
+                    encoded = codec.encode(processed_frame)
+                if encoded is not None:
+                    with recorder.span("send", seq=seq, size=len(encoded)):
+                        await websocket.send_bytes(encoded)
+
+                    # With ?stats=1 each response is followed by the index of the
+                    # frame it answers, so clients can measure latency and drops.
+                    if stats:
+                        await websocket.send_text(json.dumps({"seq": seq, "dropped": mailbox.dropped}))
+        finally:
+            live_stats["active_connections"] -= 1
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+            await checkpointer.flush()
+            angle_recorder.flush()
+            await rep_event_writer.close_session(summary)
 
     except WebSocketDisconnect:
         print("WebSocket Disconnected!")
@@ -74,6 +148,22 @@ async def live_feed(websocket: WebSocket):
         await websocket.close()
         print("WebSocket Closed")
 
+@app.get("/live-feed/stats")
+async def live_feed_stats():
+    """ Node-wide live feed counters """
+    return live_stats
+
+@app.get("/live-feed/trace/{session_id}")
+async def live_feed_trace(session_id: str):
+    """ Chrome trace-event dump of a recorded live session (open in Perfetto) """
+    recorder = flight_recorders.get(session_id)
+    if recorder is None:
+        raise HTTPException(status_code=404, detail="No flight recording for this session")
+    return JSONResponse(
+        recorder.to_chrome_trace(),
+        headers={"Content-Disposition": f'attachment; filename="live-{session_id}.trace.json"'},
+    )
+
 @app.post("/upload-video/")
 async def upload_video(file: UploadFile = File(...), difficulty: str = Query("beginner")):
     """ Process uploaded squat video for fitness tracking """
@@ -92,17 +182,36 @@ async def upload_video(file: UploadFile = File(...), difficulty: str = Query("be
 
     thresholds = get_thresholds(difficulty)
     process_frame = ProcessFrame(thresholds)
+    video_pose = session_pose(pose)
 
     while cap.isOpened():
         ret, frame = cap.read()
         if not ret:
             break
 
-        processed_frame, feedback = process_frame.process(frame, pose)
+        processed_frame, feedback = process_frame.process(frame, video_pose)
 
     cap.release()
     return {"message": "Video processed"}
 
+@app.on_event("startup")
+async def startup():
+    await ensure_indexes()
+    rep_event_writer.start()
+    angle_chunk_writer.start()
+    xp_ledger_writer.start()
+    xp_rollup.start()
+    next_workout_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_peer_connections()
+    await rep_event_writer.stop()
+    await angle_chunk_writer.stop()
+    await next_workout_queue.stop()
+    await xp_rollup.stop()
+    await xp_ledger_writer.stop()
+
 # Cleanup function
 def cleanup():
     global pose
@@ -118,6 +227,8 @@ app.include_router(workout_router, prefix="/workouts", tags=["workouts"])
 app.include_router(mealprep_router, prefix="/api")
 app.include_router(dashboard_router, prefix="/dashboard", tags=["dashboard"])
 app.include_router(settings_router, prefix="/api")
+app.include_router(webrtc_router, prefix="/webrtc", tags=["WebRTC"])
+app.include_router(angle_series_router, prefix="/live", tags=["Live sessions"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
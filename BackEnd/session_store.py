@@ -0,0 +1,83 @@
+import os
+import secrets
+import time
+import logging
+from datetime import datetime, timedelta
+from database import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Grace window (seconds) in which a dropped live-feed connection can resume.
+LIVE_SESSION_TTL = int(os.getenv("LIVE_SESSION_TTL", "120"))
+
+# "memory" keeps snapshots in this process; "mongo" shares them across workers.
+LIVE_SESSION_STORE = os.getenv("LIVE_SESSION_STORE", "memory")
+
+
+def new_session_token():
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+
+    def __init__(self, ttl=LIVE_SESSION_TTL):
+        self.ttl = ttl
+        self._entries = {}  # token -> (expires_at, snapshot)
+        self._next_eviction = 0.0
+
+    def _evict_expired(self, now):
+        # Sweep at most once per TTL period.
+        if now < self._next_eviction:
+            return
+        self._next_eviction = now + self.ttl
+        for token in [t for t, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[token]
+
+    async def load(self, token):
+        entry = self._entries.get(token)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def save(self, token, snapshot):
+        now = time.monotonic()
+        self._evict_expired(now)
+        self._entries[token] = (now + self.ttl, snapshot)
+
+    async def delete(self, token):
+        self._entries.pop(token, None)
+
+    async def ensure_indexes(self):
+        pass
+
+
+class MongoSessionStore:
+
+    def __init__(self, ttl=LIVE_SESSION_TTL):
+        self.ttl = ttl
+        # Expired documents are removed by a TTL index on expires_at.
+        self.collection = db.get_collection("live_sessions")
+
+    async def load(self, token):
+        doc = await self.collection.find_one(
+            {"_id": token, "expires_at": {"$gt": datetime.utcnow()}},
+            {"snapshot": 1},
+        )
+        return doc["snapshot"] if doc else None
+
+    async def save(self, token, snapshot):
+        await self.collection.update_one(
+            {"_id": token},
+            {"$set": {"snapshot": snapshot, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)}},
+            upsert=True,
+        )
+
+    async def delete(self, token):
+        await self.collection.delete_one({"_id": token})
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+session_store = MongoSessionStore() if LIVE_SESSION_STORE == "mongo" else MemorySessionStore()
@@ -1,23 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, EmailStr, Field
-from database import users_collection  # Consistent with auth_routes.py
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+from database import users_collection, db  # Consistent with auth_routes.py
 from bson import ObjectId
-import jwt as pyjwt  # Use pyjwt as in auth_routes.py
+from auth import get_current_user, get_existing_user
+from user_loader import current_user_doc
+from dashboard_cache import invalidate_shared
+from xp_ledger import award_xp
 from dotenv import load_dotenv
-import os
 import logging
-from typing import Literal
+from typing import Literal, Optional
 from datetime import datetime
 
 load_dotenv()
 
 router = APIRouter()
 
-# JWT setup from auth_routes.py
-JWT_SECRET = os.getenv("JWT_SECRET")
-ALGORITHM = "HS256"
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")  # Adjusted to match prefix in server.py
+SETTINGS_XP = 100
+
+# One document per submission, indexed on (user_id, submitted_at)
+feedback_collection = db.get_collection("feedback")
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -36,67 +39,19 @@ class Feedback(BaseModel):
     rating: int = Field(..., ge=1, le=5, description="Rating from 1 to 5")
     feedback_given: str = Field(..., min_length=1, description="User's feedback text")
 
-# Dependency to get the current user from JWT (aligned with auth_routes.py)
-async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
-    logger.debug(f"Raw Authorization header: {request.headers.get('Authorization')}")
-    logger.debug(f"Extracted token: {token}")
-    if not token:
-        logger.error("No token provided")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="No token provided",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    try:
-        payload = pyjwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            logger.error("Token payload missing user_id")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token: missing user_id",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        logger.debug(f"User ID from token: {user_id}")
-        # Verify user exists
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user:
-            logger.error(f"User not found in database: {user_id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found",
-            )
-        return user_id
-    except pyjwt.ExpiredSignatureError:
-        logger.error("Token has expired")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except pyjwt.InvalidTokenError as e:
-        logger.error(f"JWT decoding error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid token: {str(e)}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except Exception as e:
-        logger.error(f"Unexpected error in get_current_user: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Server error: {str(e)}",
-        )
+# The first profile update and the first feedback earn SETTINGS_XP once per user;
+# returns the user's XP total either way.
+async def award_once(user_id: str, source: str, ref=None) -> int:
+    awarded = await award_xp(user_id, SETTINGS_XP, source, ref=ref, once=True)
+    if awarded:
+        return awarded[1]
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"xp": 1})
+    return user.get("xp", 0) if user else 0
 
 # Fetch current user profile
 @router.get("/settings/profile")
-async def get_profile(user_id: str = Depends(get_current_user)):
-    logger.info(f"Fetching profile for user_id: {user_id}")
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        logger.error(f"User not found: {user_id}")
-        raise HTTPException(status_code=404, detail="User not found")
-    
+async def get_profile(user: dict = Depends(current_user_doc("username", "email", "height", "weight"))):
+    logger.info(f"Fetching profile for user_id: {user['_id']}")
     return {
         "name": user.get("username", ""),  # Use 'username' as in auth_routes.py
         "email": user.get("email", ""),
@@ -111,10 +66,6 @@ async def update_profile(
     user_id: str = Depends(get_current_user)
 ):
     logger.info(f"Updating profile for user_id: {user_id}")
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        logger.error(f"User not found: {user_id}")
-        raise HTTPException(status_code=404, detail="User not found")
 
     # Prepare update data (use 'username' instead of 'name')
     update_data = {
@@ -125,47 +76,87 @@ async def update_profile(
     }
 
     # Update the user document in MongoDB
-    result = await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": update_data}
-    )
+    try:
+        result = await users_collection.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
 
     if result.modified_count == 0:
         logger.warning(f"No changes made to profile for user_id: {user_id}")
         raise HTTPException(status_code=400, detail="No changes were made to the profile")
 
+    await invalidate_shared(user_id)  # Username shows on others' leaderboards and friends lists
+    xp = await award_once(user_id, "profile_update")
     logger.info(f"Profile updated successfully for user_id: {user_id}")
-    return {"message": "Profile updated successfully", "xp": user.get("xp", 0) + 100}
+    return {"message": "Profile updated successfully", "xp": xp}
 
 # Submit user feedback
 @router.post("/settings/feedback")
 async def submit_feedback(
     feedback: Feedback,
-    user_id: str = Depends(get_current_user)
+    user_id: str = Depends(get_existing_user)
 ):
     logger.info(f"Submitting feedback for user_id: {user_id}")
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        logger.error(f"User not found: {user_id}")
-        raise HTTPException(status_code=404, detail="User not found")
 
     # Prepare feedback data
     feedback_data = {
+        "user_id": ObjectId(user_id),
         "feedback_type": feedback.feedback_type,
         "rating": feedback.rating,
         "feedback_given": feedback.feedback_given,
-        "submitted_at": datetime.utcnow().isoformat()
+        "submitted_at": datetime.utcnow()
     }
 
-    # Append feedback to the user's feedback array
-    result = await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$push": {"feedback": feedback_data}}
-    )
-
-    if result.modified_count == 0:
-        logger.warning(f"Feedback submission failed for user_id: {user_id}")
+    try:
+        await feedback_collection.insert_one(feedback_data)
+    except Exception as e:
+        logger.error(f"Feedback submission failed for user_id: {user_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to submit feedback")
 
+    xp = await award_once(user_id, "feedback", ref=feedback_data["_id"])
     logger.info(f"Feedback submitted successfully for user_id: {user_id}")
-    return {"message": "Feedback submitted successfully", "xp": user.get("xp", 0) + 100}
\ No newline at end of file
+    return {"message": "Feedback submitted successfully", "xp": xp}
+
+# List the user's feedback, newest first; pass next_before and next_before_id back as
+# before and before_id for the next page
+@router.get("/settings/feedback")
+async def list_feedback(
+    before: Optional[datetime] = Query(None, description="Return feedback submitted before this time"),
+    before_id: Optional[str] = Query(None, description="Tie-breaker for entries submitted exactly at before"),
+    limit: int = Query(20, ge=1, le=100),
+    user_id: str = Depends(get_current_user)
+):
+    query = {"user_id": ObjectId(user_id)}
+    if before is not None and before_id is not None:
+        if not ObjectId.is_valid(before_id):
+            raise HTTPException(status_code=400, detail="Invalid before_id")
+        # Keyset on (submitted_at, _id) so entries sharing a timestamp aren't skipped
+        query["$or"] = [
+            {"submitted_at": {"$lt": before}},
+            {"submitted_at": before, "_id": {"$lt": ObjectId(before_id)}}
+        ]
+    elif before is not None:
+        query["submitted_at"] = {"$lt": before}
+
+    items = await feedback_collection.find(query, {"user_id": 0}) \
+        .sort([("submitted_at", DESCENDING), ("_id", DESCENDING)]).limit(limit).to_list(length=limit)
+
+    feedback = [
+        {
+            "id": str(item["_id"]),
+            "feedback_type": item["feedback_type"],
+            "rating": item["rating"],
+            "feedback_given": item["feedback_given"],
+            "submitted_at": item["submitted_at"].isoformat()
+        }
+        for item in items
+    ]
+    last = feedback[-1] if len(feedback) == limit else None
+    return {
+        "feedback": feedback,
+        "next_before": last["submitted_at"] if last else None,
+        "next_before_id": last["id"] if last else None
+    }
@@ -0,0 +1,78 @@
+import math
+from collections import namedtuple
+from types import SimpleNamespace
+
+# Deterministic stand-in for the MediaPipe pose model. It ignores the image and
+# replays a scripted side-view squat, so load tests can measure the server's own
+# overhead (decode, analysis, drawing, encode, I/O) without the model cost.
+# Enable with POSE_BACKEND=stub. The script position is per instance, so each
+# connection takes its own instance via session_pose() and sees the full rep
+# sequence regardless of how many other sessions are running.
+
+Landmark = namedtuple("Landmark", ["x", "y", "z", "visibility"])
+
+# Frames per squat (down and up) and standing frames between squats.
+REP_FRAMES = 30
+REST_FRAMES = 10
+
+SHIN, THIGH, TORSO = 0.18, 0.18, 0.24
+
+
+def squat_keypoints(frame_index):
+
+    # Normalized side-view joint positions for the given frame of the script.
+    position = frame_index % (REP_FRAMES + REST_FRAMES)
+    depth = math.sin(math.pi * position / REP_FRAMES) if position < REP_FRAMES else 0.0
+
+    # Vertical angles (degrees) chosen to walk the beginner state machine
+    # s1 -> s2 -> s3 -> s2 -> s1 without triggering posture faults.
+    knee_angle = math.radians(10 + 80 * depth)
+    hip_angle = math.radians(15 + 20 * depth)
+    ankle_angle = math.radians(5 + 20 * depth)
+
+    ankle = (0.50, 0.85)
+    foot = (0.58, 0.87)
+    knee = (ankle[0] + SHIN * math.sin(ankle_angle), ankle[1] - SHIN * math.cos(ankle_angle))
+    hip = (knee[0] - THIGH * math.sin(knee_angle), knee[1] - THIGH * math.cos(knee_angle))
+    shoulder = (hip[0] + TORSO * math.sin(hip_angle), hip[1] - TORSO * math.cos(hip_angle))
+    elbow = (shoulder[0] + 0.08, shoulder[1] + 0.06)
+    wrist = (elbow[0] + 0.10, elbow[1])
+    nose = (shoulder[0] + 0.04, shoulder[1] - 0.08)
+
+    return {
+        'nose': nose, 'shoulder': shoulder, 'elbow': elbow, 'wrist': wrist,
+        'hip': hip, 'knee': knee, 'ankle': ankle, 'foot': foot,
+    }
+
+
+# MediaPipe landmark indices for each joint, left and right side.
+_LANDMARK_IDS = {
+    'nose': (0,), 'shoulder': (11, 12), 'elbow': (13, 14), 'wrist': (15, 16),
+    'hip': (23, 24), 'knee': (25, 26), 'ankle': (27, 28), 'foot': (31, 32),
+}
+
+
+class StubPose:
+
+    def __init__(self):
+        self.frame_index = 0
+
+    def process(self, frame):
+
+        landmarks = [Landmark(0.0, 0.0, 0.0, 0.0)] * 33
+        for joint, (x, y) in squat_keypoints(self.frame_index).items():
+            for idx in _LANDMARK_IDS[joint]:
+                landmarks[idx] = Landmark(x, y, 0.0, 1.0)
+
+        self.frame_index += 1
+
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=landmarks))
+
+    def close(self):
+        pass
+
+
+def session_pose(pose):
+    """The pose model for one connection or video: a fresh script for the stub,
+    the shared model otherwise."""
+    return StubPose() if isinstance(pose, StubPose) else pose
@@ -52,4 +52,10 @@ def get_thresholds_pro():
                             
                  }
                  
-    return thresholds
\ No newline at end of file
+    return thresholds
+
+
+
+# Get thresholds for the requested difficulty
+def get_thresholds(difficulty: str):
+    return get_thresholds_pro() if difficulty == "pro" else get_thresholds_beginner()
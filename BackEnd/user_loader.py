@@ -0,0 +1,56 @@
+import logging
+from bson import ObjectId
+from fastapi import Depends, HTTPException, Request
+from database import users_collection
+from auth import get_current_user
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class UserLoader:
+    """Request-scoped cache of user documents.
+
+    Each user is fetched at most once per request with the union of the
+    fields asked for so far; a later call asking for fields the cached
+    projection lacks refetches with the widened projection.
+    """
+
+    def __init__(self):
+        self._docs = {}  # user_id -> (fields or None for the full document, doc)
+        self.round_trips = 0
+
+    async def get(self, user_id, fields=None):
+        cached = self._docs.get(user_id)
+        if cached is not None:
+            cached_fields, doc = cached
+            if cached_fields is None or (fields is not None and set(fields) <= cached_fields):
+                return doc
+            fields = None if fields is None else set(fields) | cached_fields
+
+        projection = None if fields is None else {field: 1 for field in fields}
+        doc = await users_collection.find_one({"_id": ObjectId(user_id)}, projection)
+        self.round_trips += 1
+
+        self._docs[user_id] = (None if fields is None else set(fields), doc)
+        return doc
+
+
+# Dependency: one loader per request, shared by every dependency and handler
+async def get_user_loader(request: Request):
+    loader = UserLoader()
+    request.state.user_loader = loader
+    yield loader
+    logger.debug(f"{request.method} {request.url.path}: {loader.round_trips} user read(s)")
+
+
+def current_user_doc(*fields):
+    """Dependency factory: the current user's document, projected to fields."""
+
+    async def dependency(user_id: str = Depends(get_current_user), loader: UserLoader = Depends(get_user_loader)):
+        user = await loader.get(user_id, fields or None)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    return dependency
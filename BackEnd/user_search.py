@@ -0,0 +1,46 @@
+import os
+import time
+from database import users_collection
+from auth import TTLCache
+
+# Typeahead over usernames: an anchored, case-insensitive prefix range scan on
+# the users username_ci index. Queries must pass the same collation as the
+# index or MongoDB will not use it.
+USERNAME_COLLATION = {"locale": "en", "strength": 2}
+USER_SEARCH_CACHE_SIZE = int(os.getenv("USER_SEARCH_CACHE_SIZE", "1024"))
+USER_SEARCH_CACHE_TTL = float(os.getenv("USER_SEARCH_CACHE_TTL", "30"))
+USER_SEARCH_LIMIT = 10
+
+# U+FFFF carries the highest primary weight in the root collation, so
+# [prefix, prefix + U+FFFF) covers every string starting with prefix.
+_PREFIX_END = "\uffff"
+
+
+class UsernameSearch:
+
+    def __init__(self, collection=users_collection, cache_size=USER_SEARCH_CACHE_SIZE, ttl=USER_SEARCH_CACHE_TTL):
+        self.collection = collection
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=cache_size)
+
+    async def search(self, prefix: str, limit: int = USER_SEARCH_LIMIT) -> list:
+        key = (prefix.casefold(), limit)
+        results = self._cache.get(key)
+        if results is not None:
+            return results
+
+        cursor = self.collection.find(
+            {"username": {"$gte": prefix, "$lt": prefix + _PREFIX_END}},
+            {"_id": 1, "username": 1, "xp": 1},
+            collation=USERNAME_COLLATION,
+        ).sort("username", 1).limit(limit)
+        results = [
+            {"id": str(user["_id"]), "username": user["username"], "xp": user.get("xp", 0)}
+            for user in await cursor.to_list(length=limit)
+        ]
+
+        self._cache.put(key, results, time.time() + self.ttl)
+        return results
+
+
+username_search = UsernameSearch()
@@ -98,6 +98,24 @@ def find_angle(p1, p2, ref_pt = np.array([0,0])):
 
 
 
+def get_frame_signature(frame, size=(32, 24)):
+
+    # Tiny grayscale thumbnail used to detect (near) duplicate frames.
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+
+
+def frame_difference(signature_a, signature_b):
+
+    # Mean absolute pixel difference between two frame signatures (0-255).
+    return float(cv2.absdiff(signature_a, signature_b).mean())
+
+
+
+
 def get_landmark_array(pose_landmark, key, frame_width, frame_height):
 
     denorm_x = int(pose_landmark[key].x * frame_width)
@@ -0,0 +1,84 @@
+"""Loopback check for the WebRTC ingest path: a local aiortc peer streams a
+synthetic camera track into answer_offer() and prints what comes back.
+
+Usage: python webrtc_loopback.py [--seconds 5] [--annotate]
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+from aiortc import RTCPeerConnection, VideoStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import VideoFrame
+from utils import get_mediapipe_pose
+from webrtc_routes import answer_offer, close_peer_connections
+
+
+class SyntheticCameraTrack(VideoStreamTrack):
+
+    def __init__(self, width=640, height=480):
+        super().__init__()
+        self.width = width
+        self.height = height
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+        image = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        image[:, (pts // 3000) % self.width] = 255  # Moving bar so frames differ.
+
+        frame = VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = pts
+        frame.time_base = time_base
+        return frame
+
+
+async def run(seconds, annotate):
+    pose = get_mediapipe_pose()
+    client = RTCPeerConnection()
+    stats = {"messages": 0, "frames": 0}
+
+    channel = client.createDataChannel("analysis")
+
+    @channel.on("message")
+    def on_message(message):
+        stats["messages"] += 1
+        print("data channel:", message)
+
+    @client.on("track")
+    def on_track(track):
+        async def drain():
+            try:
+                while True:
+                    await track.recv()
+                    stats["frames"] += 1
+            except MediaStreamError:
+                pass
+        asyncio.ensure_future(drain())
+
+    # addTrack negotiates sendrecv, so an annotated track can come back on it.
+    client.addTrack(SyntheticCameraTrack())
+
+    await client.setLocalDescription(await client.createOffer())
+    start = time.perf_counter()
+    answer = await answer_offer(client.localDescription, pose, annotate=annotate)
+    await client.setRemoteDescription(answer)
+    print(f"offer/answer in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    await asyncio.sleep(seconds)
+    print(f"connection {client.connectionState}, {stats['messages']} messages, {stats['frames']} annotated frames")
+
+    await client.close()
+    await close_peer_connections()
+    pose.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--annotate", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.annotate))
+
+
+if __name__ == "__main__":
+    main()
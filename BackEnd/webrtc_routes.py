@@ -0,0 +1,177 @@
+import os
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import VideoFrame
+from process_frame import ProcessFrame
+from thresholds import get_thresholds
+from stub_pose import session_pose
+from live_session import FrameMailbox
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+webrtc_router = APIRouter()
+
+# Open peer connections and the tasks driving analysis without an outgoing
+# track, both closed on shutdown.
+peer_connections = set()
+consumer_tasks = set()
+
+# Decoding, pose inference and drawing run off the event loop on a bounded
+# pool. The pose model is shared across connections and MediaPipe graphs are
+# not thread-safe, so the default is a single analysis thread.
+WEBRTC_ANALYSIS_WORKERS = int(os.getenv("WEBRTC_ANALYSIS_WORKERS", "1"))
+_analysis_executor = ThreadPoolExecutor(max_workers=WEBRTC_ANALYSIS_WORKERS, thread_name_prefix="webrtc-analysis")
+
+
+class Offer(BaseModel):
+    sdp: str
+    type: str
+    difficulty: str = "beginner"
+    annotate: bool = False  # Also send the annotated video back as a track
+
+
+class AnalysisTrack(MediaStreamTrack):
+    """Runs squat analysis on the newest decoded frame of the incoming camera
+    track; frames that arrive while one is being analysed replace each other."""
+
+    kind = "video"
+
+    def __init__(self, track, process_frame, pose):
+        super().__init__()
+        self.track = track
+        self.process_frame = process_frame
+        self.pose = pose
+        self.channel = None
+        self.last_counts = None
+        self.mailbox = FrameMailbox()
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                self.mailbox.put(await self.track.recv())
+        except MediaStreamError:
+            pass
+        finally:
+            self.mailbox.close()
+
+    def _publish(self, feedback):
+        if self.channel is None or self.channel.readyState != "open":
+            return
+
+        counts = (self.process_frame.state_tracker['SQUAT_COUNT'], self.process_frame.state_tracker['IMPROPER_SQUAT'])
+        if feedback is None and counts == self.last_counts:
+            return
+
+        self.last_counts = counts
+        self.channel.send(json.dumps({"correct": counts[0], "incorrect": counts[1], "feedback": feedback}))
+
+    def _analyse(self, frame):
+        image = frame.to_ndarray(format="bgr24")
+        processed_frame, feedback = self.process_frame.process(image, self.pose)
+
+        new_frame = VideoFrame.from_ndarray(processed_frame, format="bgr24")
+        new_frame.pts = frame.pts
+        new_frame.time_base = frame.time_base
+        return new_frame, feedback
+
+    async def recv(self):
+        frame, _ = await self.mailbox.get()
+        if frame is None:
+            raise MediaStreamError
+
+        new_frame, feedback = await asyncio.get_running_loop().run_in_executor(
+            _analysis_executor, self._analyse, frame
+        )
+        self._publish(feedback)
+        return new_frame
+
+    def stop(self):
+        super().stop()
+        self._reader.cancel()
+        self.mailbox.close()
+
+
+async def _consume(track):
+    # Without an outgoing track nothing pulls frames, so drive the analysis here.
+    try:
+        while True:
+            await track.recv()
+    except MediaStreamError:
+        pass
+
+
+async def answer_offer(offer: RTCSessionDescription, pose, difficulty="beginner", annotate=False):
+    """Create a peer connection for the offer and return the local answer."""
+    pc = RTCPeerConnection()
+    peer_connections.add(pc)
+
+    process_frame = ProcessFrame(thresholds=get_thresholds(difficulty), flip_frame=True)
+
+    # The data channel and the video track can arrive in either order.
+    session = {"channel": None, "analysis": None}
+
+    @pc.on("datachannel")
+    def on_datachannel(channel):
+        session["channel"] = channel
+        if session["analysis"] is not None:
+            session["analysis"].channel = channel
+
+    @pc.on("track")
+    def on_track(track):
+        if track.kind != "video":
+            return
+
+        analysis = AnalysisTrack(track, process_frame, session_pose(pose))
+        analysis.channel = session["channel"]
+        session["analysis"] = analysis
+
+        if annotate:
+            pc.addTrack(analysis)
+        else:
+            task = asyncio.ensure_future(_consume(analysis))
+            consumer_tasks.add(task)
+            task.add_done_callback(consumer_tasks.discard)
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        logger.info("WebRTC connection state: %s", pc.connectionState)
+        if pc.connectionState in ("failed", "closed"):
+            await pc.close()
+            peer_connections.discard(pc)
+            if session["analysis"] is not None:
+                session["analysis"].stop()
+
+    await pc.setRemoteDescription(offer)
+    await pc.setLocalDescription(await pc.createAnswer())
+    return pc.localDescription
+
+
+async def close_peer_connections():
+    await asyncio.gather(*(pc.close() for pc in peer_connections))
+    peer_connections.clear()
+    for task in consumer_tasks:
+        task.cancel()
+    await asyncio.gather(*consumer_tasks, return_exceptions=True)
+
+
+@webrtc_router.post("/offer")
+async def offer(request: Request, params: Offer):
+    """ SDP offer/answer for WebRTC live analysis """
+    if params.type != "offer":
+        raise HTTPException(status_code=400, detail="Expected an SDP offer")
+
+    answer = await answer_offer(
+        RTCSessionDescription(sdp=params.sdp, type=params.type),
+        request.app.state.pose,
+        difficulty=params.difficulty,
+        annotate=params.annotate,
+    )
+    return {"sdp": answer.sdp, "type": answer.type}
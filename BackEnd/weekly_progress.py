@@ -0,0 +1,138 @@
+"""Per-user, per-week workout counters.
+
+complete_workout increments the current week's document atomically and the
+dashboard reads it with one indexed find_one. rebuild() recomputes the
+counters from the workouts collection, either to backfill or (with verify)
+to report drift without writing:
+
+    python weekly_progress.py [--verify] [--user USER_ID]
+"""
+import sys
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+weekly_progress_collection = db.get_collection("weekly_progress")
+workouts_collection = db.get_collection("workouts")
+
+COUNTERS = ("completed", "xp", "minutes")
+
+
+def parse_iso_datetime(field: str) -> dict:
+    """Aggregation expression turning a naive datetime.isoformat() string field
+    (with or without microseconds) into a UTC date, or null if it can't; date
+    values pass through. Only the first 19 characters, to the second, are parsed."""
+    return {"$cond": [
+        {"$eq": [{"$type": field}, "string"]},
+        {"$dateFromString": {
+            "dateString": {"$substrCP": [field, 0, 19]},
+            "format": "%Y-%m-%dT%H:%M:%S",
+            "timezone": "UTC",
+            "onError": None
+        }},
+        field,
+    ]}
+
+
+def week_start_of(moment: datetime) -> datetime:
+    """Monday 00:00 UTC of the week containing moment."""
+    day = datetime(moment.year, moment.month, moment.day)
+    return day - timedelta(days=day.weekday())
+
+
+async def record_workout(user_id: ObjectId, workout: dict, completed_at: datetime) -> dict:
+    """Count a completed workout and return the week's updated counters."""
+    doc = await weekly_progress_collection.find_one_and_update(
+        {"user_id": user_id, "week_start": week_start_of(completed_at)},
+        {"$inc": {
+            "completed": 1,
+            "xp": workout.get("xp", 0),
+            "minutes": workout.get("duration", 0),
+        }},
+        projection={"_id": 0, **{counter: 1 for counter in COUNTERS}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return {counter: doc.get(counter, 0) for counter in COUNTERS}
+
+
+async def get_weekly_progress(user_id: ObjectId, now: datetime = None) -> dict:
+    doc = await weekly_progress_collection.find_one(
+        {"user_id": user_id, "week_start": week_start_of(now or datetime.utcnow())},
+        {"_id": 0, **{counter: 1 for counter in COUNTERS}},
+    ) or {}
+    return {counter: doc.get(counter, 0) for counter in COUNTERS}
+
+
+def _rebuild_pipeline(user_id=None):
+    match = {"completed": True}
+    if user_id is not None:
+        match["user_id"] = user_id
+
+    return [
+        {"$match": match},
+        # completed_at is stored as an ISO string by complete_workout
+        {"$set": {"_completed_at": parse_iso_datetime("$completed_at")}},
+        {"$match": {"_completed_at": {"$type": "date"}}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "week_start": {"$dateFromParts": {
+                    "isoWeekYear": {"$isoWeekYear": "$_completed_at"},
+                    "isoWeek": {"$isoWeek": "$_completed_at"},
+                    "isoDayOfWeek": 1,
+                }},
+            },
+            "completed": {"$sum": 1},
+            "xp": {"$sum": {"$ifNull": ["$xp", 0]}},
+            "minutes": {"$sum": {"$ifNull": ["$duration", 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "week_start": "$_id.week_start",
+            **{counter: 1 for counter in COUNTERS},
+        }},
+    ]
+
+
+async def rebuild(user_id=None, verify=False):
+    """Recompute counters from workout history; with verify, only report mismatches."""
+    pipeline = _rebuild_pipeline(user_id)
+    if not verify:
+        # $merge needs the unique (user_id, week_start) index created at startup.
+        pipeline.append({"$merge": {
+            "into": weekly_progress_collection.name,
+            "on": ["user_id", "week_start"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }})
+        await workouts_collection.aggregate(pipeline).to_list(length=None)
+        logger.info("Weekly progress rebuilt")
+        return 0
+
+    mismatches = 0
+    async for expected in workouts_collection.aggregate(pipeline):
+        stored = await weekly_progress_collection.find_one(
+            {"user_id": expected["user_id"], "week_start": expected["week_start"]}
+        ) or {}
+        if any(stored.get(counter, 0) != expected[counter] for counter in COUNTERS):
+            mismatches += 1
+            logger.warning(
+                f"Weekly progress drift for {expected['user_id']} week {expected['week_start']:%Y-%m-%d}: "
+                f"stored {[stored.get(c, 0) for c in COUNTERS]}, expected {[expected[c] for c in COUNTERS]}"
+            )
+    logger.info(f"Verified weekly progress: {mismatches} mismatched week(s)")
+    return mismatches
+
+
+if __name__ == "__main__":
+    user = sys.argv[sys.argv.index("--user") + 1] if "--user" in sys.argv else None
+    mismatched = asyncio.run(rebuild(ObjectId(user) if user else None, verify="--verify" in sys.argv))
+    sys.exit(1 if mismatched else 0)
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from database import db
+from auth import get_current_user
+from user_loader import current_user_doc
+from weekly_progress import record_workout
+from dashboard_events import publish_weekly_progress, sse
+from xp_ledger import award_xp
+from llm import llm, LLMError, LLMUnavailable
+from workout_cache import workout_plan_cache, profile_fingerprint
+from next_workout import NextWorkoutQueue, claim_next_workout
+from json_stream import IncrementalObjectParser
 from bson import ObjectId
 from pydantic import BaseModel
 from typing import List, Optional
-import jwt as pyjwt
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-import json
 import logging
 from datetime import datetime
 
@@ -20,10 +26,6 @@ load_dotenv()
 
 workout_router = APIRouter()
 
-JWT_SECRET = os.getenv("JWT_SECRET")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
 class Exercise(BaseModel):
     name: str
     sets: int
@@ -55,117 +57,95 @@ class Workout(BaseModel):
 workouts_collection = db.get_collection("workouts")
 users_collection = db.get_collection("users")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = pyjwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            raise credentials_exception
-    except pyjwt.PyJWTError:
-        raise credentials_exception
-    return user_id
-
-def generate_workout_with_gemini(onboarding: dict) -> Workout:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        if not GEMINI_API_KEY:
-            logger.error("Gemini API key is missing")
-            raise HTTPException(status_code=500, detail="Gemini API key is not configured")
-
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        logger.debug("Onboarding data: %s", onboarding)
-
-        goals = onboarding.get("goals", ["general fitness"])
-        experience = onboarding.get("experience", "beginner")
-        schedule = onboarding.get("schedule", {"daysPerWeek": 3, "timePerSession": "30-45 minutes"})
-        assistance = onboarding.get("assistance", "moderate")
-        fitness_profile = onboarding.get("fitnessProfile", {"location": "gym"})
-        body_metrics = onboarding.get("bodyMetrics", {"height": 170, "weight": 70, "unit": "metric"})
-
-        prompt = f"""
-        Generate a personalized workout plan based on the following user onboarding data:
-        - Goals: {', '.join(goals)}
-        - Experience Level: {experience}
-        - Schedule: {schedule['daysPerWeek']} days/week, {schedule['timePerSession']} per session
-        - Assistance Level: {assistance}
-        - Fitness Location: {fitness_profile['location']}
-        - Body Metrics: Height {body_metrics['height']} {body_metrics['unit']}, Weight {body_metrics['weight']} {body_metrics['unit'] == 'metric' and 'kg' or 'lbs'}
-
-        Create a workout plan that aligns with the user's goals, experience, and schedule. The workout should include a mix of exercises that reflect the user's goals and experience level. 
-
-        For the title of the workout, generate a creative and unique name that summarizes the overall focus of the exercises. The title should be concise, use fitness-related terminology, and reflect the types of exercises included. To ensure variety, avoid repetitive or generic titles, and do not use the phrase "Beginner Flexibility & Mobility" in the title. Do not include unnecessary suffixes like "(Week 1)" unless the workout is explicitly part of a multi-week program.
-
-        Return the workout in the following JSON format without additional text or code fences (e.g., ```json):
+def build_workout_prompt(onboarding: dict) -> str:
+    goals = onboarding.get("goals", ["general fitness"])
+    experience = onboarding.get("experience", "beginner")
+    schedule = onboarding.get("schedule", {"daysPerWeek": 3, "timePerSession": "30-45 minutes"})
+    assistance = onboarding.get("assistance", "moderate")
+    fitness_profile = onboarding.get("fitnessProfile", {"location": "gym"})
+    body_metrics = onboarding.get("bodyMetrics", {"height": 170, "weight": 70, "unit": "metric"})
+
+    prompt = f"""
+    Generate a personalized workout plan based on the following user onboarding data:
+    - Goals: {', '.join(goals)}
+    - Experience Level: {experience}
+    - Schedule: {schedule['daysPerWeek']} days/week, {schedule['timePerSession']} per session
+    - Assistance Level: {assistance}
+    - Fitness Location: {fitness_profile['location']}
+    - Body Metrics: Height {body_metrics['height']} {body_metrics['unit']}, Weight {body_metrics['weight']} {body_metrics['unit'] == 'metric' and 'kg' or 'lbs'}
+
+    Create a workout plan that aligns with the user's goals, experience, and schedule. The workout should include a mix of exercises that reflect the user's goals and experience level. 
+
+    For the title of the workout, generate a creative and unique name that summarizes the overall focus of the exercises. The title should be concise, use fitness-related terminology, and reflect the types of exercises included. To ensure variety, avoid repetitive or generic titles, and do not use the phrase "Beginner Flexibility & Mobility" in the title. Do not include unnecessary suffixes like "(Week 1)" unless the workout is explicitly part of a multi-week program.
+
+    Return the workout in the following JSON format without additional text or code fences (e.g., ```json):
+    {{
+      "title": "string",
+      "type": "strength|cardio|recovery",
+      "duration": int (total minutes),
+      "intensity": "Low|Medium|High",
+      "description": "string",
+      "xp": int (total XP for the workout),
+      "exercises": [
         {{
-          "title": "string",
-          "type": "strength|cardio|recovery",
-          "duration": int (total minutes),
-          "intensity": "Low|Medium|High",
+          "name": "string",
+          "sets": int,
+          "reps": "string (e.g., '10-12')",
+          "weight": float (kg, optional),
+          "duration": int (minutes, optional),
           "description": "string",
-          "xp": int (total XP for the workout),
-          "exercises": [
-            {{
-              "name": "string",
-              "sets": int,
-              "reps": "string (e.g., '10-12')",
-              "weight": float (kg, optional),
-              "duration": int (minutes, optional),
-              "description": "string",
-              "restTime": int (seconds),
-              "xp": int (XP for this exercise)
-            }}
-          ]
+          "restTime": int (seconds),
+          "xp": int (XP for this exercise)
         }}
-        """
-
-        logger.info("Sending prompt to Gemini API")
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 1.0,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-            }
-        )
-        raw_response = response.text.strip()
-        logger.debug("Raw response from Gemini: %s", raw_response)
-
-        cleaned_response = raw_response.replace("```json", "").replace("```", "").strip()
-        logger.debug("Cleaned response: %s", cleaned_response)
-
-        workout_data = json.loads(cleaned_response)
+      ]
+    }}
+    """
+    return prompt
+
+async def generate_workout_with_llm(onboarding: dict) -> Workout:
+    try:
+        logger.debug("Onboarding data: %s", onboarding)
+        prompt = build_workout_prompt(onboarding)
+
+        logger.info("Sending workout prompt to LLM")
+        workout_data = await llm.generate_json(prompt, kind="workout")
         logger.info("Successfully parsed JSON response")
 
-        workout = Workout(**workout_data, user_id="")
-        return workout  # Moved inside try block
+        return Workout(**workout_data, user_id="")
 
-    except json.JSONDecodeError as e:
-        logger.error("JSON parsing error: %s - Cleaned Response: %s", str(e), cleaned_response)
-        raise HTTPException(status_code=500, detail=f"Failed to parse AI-generated workout: {str(e)}")
-    except genai.GenerationError as e:
-        logger.error("Gemini API error: %s", str(e))
-        raise HTTPException(status_code=500, detail=f"Gemini API failed: {str(e)}")
+    except LLMUnavailable as e:
+        logger.error("LLM unavailable: %s", str(e))
+        raise HTTPException(status_code=503, detail="Workout generation is temporarily unavailable",
+                            headers={"Retry-After": str(int(e.retry_after) or 1)})
+    except LLMError as e:
+        logger.error("LLM error: %s", str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to generate workout: {str(e)}")
     except Exception as e:
-        logger.error("Unexpected error in generate_workout_with_gemini: %s", str(e))
+        logger.error("Unexpected error in generate_workout_with_llm: %s", str(e))
         raise HTTPException(status_code=500, detail=f"Error generating workout: {str(e)}")
     
-@workout_router.post("/generate-workout", status_code=201)
-async def generate_workout(user_id: str = Depends(get_current_user)):
-    logger.info(f"Generating workout for user_id: {user_id}")
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user or "onboarding" not in user:
-        logger.error(f"Onboarding data not found for user_id: {user_id}")
-        raise HTTPException(status_code=404, detail="Onboarding data not found")
-
-    workout = generate_workout_with_gemini(user["onboarding"])
+next_workout_queue = NextWorkoutQueue(generate_workout_with_llm)
+
+async def ready_workout(user_id: str, onboarding: dict) -> Optional[Workout]:
+    """The plan pre-generated on the last completion, else a pooled plan for
+    this profile, else None; tops the profile's pool up in the background."""
+    pending = await claim_next_workout(user_id, onboarding)
+    if pending is not None:
+        logger.info(f"Serving pre-generated workout for user_id: {user_id}")
+        return Workout(**pending)
+
+    fingerprint = profile_fingerprint(onboarding)
+    cached = workout_plan_cache.take(fingerprint)
+    # Repeat profiles only: a miss tops up one spare plan, a hit refills the full pool
+    workout_plan_cache.refill(fingerprint, lambda: generate_workout_with_llm(onboarding),
+                              target=None if cached is not None else 1)
+    if cached is None:
+        return None
+    logger.info(f"Serving cached workout plan for profile {fingerprint}")
+    return Workout(**cached)
+
+async def save_generated_workout(user_id: str, workout: Workout) -> dict:
     workout.user_id = user_id
-
     workout_dict = workout.dict()
     workout_dict["user_id"] = ObjectId(user_id)
     result = await workouts_collection.insert_one(workout_dict)
@@ -173,9 +153,73 @@ async def generate_workout(user_id: str = Depends(get_current_user)):
 
     workout_dict["_id"] = str(result.inserted_id)
     workout_dict["user_id"] = str(workout_dict["user_id"])
+    return workout_dict
+
+@workout_router.post("/generate-workout", status_code=201)
+async def generate_workout(user: dict = Depends(current_user_doc("onboarding"))):
+    user_id = str(user["_id"])
+    logger.info(f"Generating workout for user_id: {user_id}")
+    if "onboarding" not in user:
+        logger.error(f"Onboarding data not found for user_id: {user_id}")
+        raise HTTPException(status_code=404, detail="Onboarding data not found")
+
+    workout = await ready_workout(user_id, user["onboarding"])
+    if workout is None:
+        workout = await generate_workout_with_llm(user["onboarding"])
+
+    workout_dict = await save_generated_workout(user_id, workout)
     logger.debug("Generated workout response: %s", workout_dict)
     return workout_dict
 
+async def workout_event_stream(user_id: str, onboarding: dict):
+    try:
+        workout = await ready_workout(user_id, onboarding)
+        if workout is not None:
+            # Nothing to wait for: replay the plan as the same events
+            for key, value in workout.dict(exclude={"exercises", "user_id", "completed", "completed_at"}).items():
+                yield sse("metadata", {key: value})
+            for index, exercise in enumerate(workout.exercises):
+                yield sse("exercise", {"index": index, **exercise.dict()})
+        else:
+            parser = IncrementalObjectParser()
+            exercises = 0
+            async for chunk in llm.stream(build_workout_prompt(onboarding), kind="workout"):
+                for event, key, value in parser.feed(chunk):
+                    if event == "field":
+                        yield sse("metadata", {key: value})
+                    elif key == "exercises":
+                        yield sse("exercise", {"index": exercises, **Exercise(**value).dict()})
+                        exercises += 1
+            workout = Workout(**parser.close(), user_id="")
+
+        yield sse("done", await save_generated_workout(user_id, workout))
+
+    except LLMUnavailable as e:
+        logger.error("LLM unavailable: %s", str(e))
+        yield sse("error", {"detail": "Workout generation is temporarily unavailable",
+                            "retry_after": int(e.retry_after) or 1})
+    except (LLMError, ValueError) as e:
+        # ValueError covers malformed JSON and Exercise/Workout validation errors
+        logger.error("Streaming workout generation failed: %s", str(e))
+        yield sse("error", {"detail": f"Failed to generate workout: {str(e)}"})
+
+# Same as /generate-workout, streamed as server-sent events: one "metadata" event
+# per top-level field, one "exercise" event per exercise as soon as it is complete,
+# then "done" with the saved workout (or "error")
+@workout_router.post("/generate-workout/stream")
+async def generate_workout_stream(user: dict = Depends(current_user_doc("onboarding"))):
+    user_id = str(user["_id"])
+    logger.info(f"Streaming workout generation for user_id: {user_id}")
+    if "onboarding" not in user:
+        logger.error(f"Onboarding data not found for user_id: {user_id}")
+        raise HTTPException(status_code=404, detail="Onboarding data not found")
+
+    return StreamingResponse(
+        workout_event_stream(user_id, user["onboarding"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @workout_router.post("/workouts", status_code=201)
 async def add_workout(workout: Workout, user_id: str = Depends(get_current_user)):
     workout_dict = workout.dict(exclude_unset=True)
@@ -242,23 +286,24 @@ async def complete_workout(workout_id: str, user_id: str = Depends(get_current_u
         raise HTTPException(status_code=400, detail="Workout already completed")
 
     now = datetime.utcnow()
+    # Conditional on not yet completed, so a double submit cannot count twice
     update_result = await workouts_collection.update_one(
-        {"_id": ObjectId(workout_id)},
+        {"_id": ObjectId(workout_id), "completed": {"$ne": True}},
         {"$set": {"completed": True, "completed_at": now.isoformat()}}
     )
     if update_result.modified_count == 0:
-        raise HTTPException(status_code=500, detail="Failed to mark workout as completed")
+        raise HTTPException(status_code=400, detail="Workout already completed")
 
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    progress = await record_workout(ObjectId(user_id), workout, now)
 
-    current_xp = user.get("xp", 0)
-    new_xp = current_xp + workout["xp"]
+    awarded = await award_xp(user_id, workout["xp"], "workout", ref=workout["_id"])
+    if awarded is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"xp": new_xp}}
-    )
+    _, new_xp = awarded
     logger.info(f"Added {workout['xp']} XP to user {user_id}. New XP: {new_xp}")
+    publish_weekly_progress(user_id, progress)
+
+    # The next request is almost always for a new plan: start on it now
+    next_workout_queue.enqueue(user_id)
     return {"message": "Workout completed successfully", "xp_added": workout["xp"], "total_xp": new_xp}
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Generated workout plans pooled by a normalized onboarding fingerprint. Users
+# with the same fingerprint are served a pooled variant (each variant is
+# handed out once) and the pool is refilled in the background, but only for
+# fingerprints requested at least WORKOUT_CACHE_MIN_SEEN times: a profile seen
+# once is probably unique, and pre-generating for it would double LLM spend.
+WORKOUT_CACHE_SIZE = int(os.getenv("WORKOUT_CACHE_SIZE", "1000"))
+WORKOUT_CACHE_VARIANTS = int(os.getenv("WORKOUT_CACHE_VARIANTS", "3"))
+WORKOUT_CACHE_TTL = float(os.getenv("WORKOUT_CACHE_TTL", str(24 * 3600)))
+WORKOUT_CACHE_MIN_SEEN = int(os.getenv("WORKOUT_CACHE_MIN_SEEN", "2"))
+
+HEIGHT_BUCKET_CM = 10
+WEIGHT_BUCKET_KG = 10
+
+
+def _number(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def profile_fingerprint(onboarding: dict) -> str:
+    """Stable key over the onboarding fields the workout prompt uses, with
+    body metrics converted to metric and bucketed."""
+    schedule = onboarding.get("schedule") or {}
+    metrics = onboarding.get("bodyMetrics") or {}
+    height, weight = _number(metrics.get("height"), 170), _number(metrics.get("weight"), 70)
+    if metrics.get("unit", "metric") != "metric":
+        height, weight = height * 2.54, weight * 0.4536
+
+    profile = {
+        "goals": sorted(str(goal).strip().lower() for goal in onboarding.get("goals") or ["general fitness"]),
+        "experience": str(onboarding.get("experience", "beginner")).strip().lower(),
+        "days": schedule.get("daysPerWeek", 3),
+        "session": str(schedule.get("timePerSession", "30-45 minutes")).strip().lower(),
+        "assistance": str(onboarding.get("assistance", "moderate")).strip().lower(),
+        "location": str((onboarding.get("fitnessProfile") or {}).get("location", "gym")).strip().lower(),
+        "height": int(height // HEIGHT_BUCKET_CM * HEIGHT_BUCKET_CM),
+        "weight": int(weight // WEIGHT_BUCKET_KG * WEIGHT_BUCKET_KG),
+    }
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:20]
+
+
+class WorkoutPlanCache:
+
+    def __init__(self, maxsize=WORKOUT_CACHE_SIZE, variants=WORKOUT_CACHE_VARIANTS, ttl=WORKOUT_CACHE_TTL,
+                 min_seen=WORKOUT_CACHE_MIN_SEEN):
+        self.maxsize = maxsize
+        self.variants = variants
+        self.ttl = ttl
+        self.min_seen = min_seen
+        self._pools = OrderedDict()  # fingerprint -> [(expires_at, workout dict)]
+        self._seen = OrderedDict()  # fingerprint -> take() calls, LRU-bounded like the pools
+        self._refilling = set()
+        self._tasks = set()
+        self.hits = self.misses = 0
+
+    def _pool(self, key):
+        now = time.time()
+        pool = [entry for entry in self._pools.get(key, []) if entry[0] > now]
+        if pool:
+            self._pools[key] = pool
+            self._pools.move_to_end(key)
+        else:
+            self._pools.pop(key, None)
+        return pool
+
+    def take(self, key):
+        """Remove and return a random pooled plan (a dict), or None."""
+        self._seen[key] = self._seen.get(key, 0) + 1
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+
+        pool = self._pool(key)
+        if not pool:
+            self.misses += 1
+            return None
+        self.hits += 1
+        _, workout = pool.pop(random.randrange(len(pool)))
+        return workout
+
+    def put(self, key, workout: dict):
+        pool = self._pool(key)
+        if len(pool) >= self.variants:
+            return
+        pool.append((time.time() + self.ttl, workout))
+        self._pools[key] = pool
+        self._pools.move_to_end(key)
+        while len(self._pools) > self.maxsize:
+            self._pools.popitem(last=False)
+
+    def refill(self, key, generate, target=None):
+        """Top the pool up to target (default `variants`) plans in the background;
+        generate is an async callable returning a validated Workout. One refill
+        per key at a time, and none for keys taken fewer than min_seen times."""
+        target = min(target or self.variants, self.variants)
+        if self._seen.get(key, 0) < self.min_seen:
+            return
+        if key in self._refilling or len(self._pool(key)) >= target:
+            return
+        self._refilling.add(key)
+        task = asyncio.create_task(self._refill(key, generate, target))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key, generate, target):
+        try:
+            while len(self._pool(key)) < target:
+                workout = await generate()
+                self.put(key, workout.dict())
+        except Exception as e:
+            logger.warning(f"Workout pool refill failed for {key}: {e}")
+        finally:
+            self._refilling.discard(key)
+
+
+workout_plan_cache = WorkoutPlanCache()
@@ -0,0 +1,159 @@
+"""Single entry point for XP changes.
+
+award_xp applies an atomic $inc to the user's cached xp total and appends an
+immutable ledger entry (user, source, amount, timestamp) through a batched
+writer. XPRollup periodically recomputes per-day totals from the ledger and
+per-week and per-season totals from the day totals, so time-windowed
+leaderboards are indexed reads of xp_totals.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database import db, users_collection
+from live_workouts import BatchWriter
+from dashboard_cache import invalidate_shared
+from dashboard_events import publish_xp
+from weekly_progress import week_start_of
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+XP_ROLLUP_INTERVAL = float(os.getenv("XP_ROLLUP_INTERVAL", "60"))
+XP_SEASON_MONTHS = int(os.getenv("XP_SEASON_MONTHS", "3"))
+
+PERIODS = ("day", "week", "season")
+
+xp_ledger_collection = db.get_collection("xp_ledger")
+xp_totals_collection = db.get_collection("xp_totals")
+xp_ledger_writer = BatchWriter(xp_ledger_collection)
+
+
+def season_start_of(moment: datetime) -> datetime:
+    month = (moment.month - 1) // XP_SEASON_MONTHS * XP_SEASON_MONTHS + 1
+    return datetime(moment.year, month, 1)
+
+
+def period_start(period: str, moment: datetime) -> datetime:
+    if period == "day":
+        return datetime(moment.year, moment.month, moment.day)
+    if period == "week":
+        return week_start_of(moment)
+    return season_start_of(moment)
+
+
+async def award_xp(user_id, amount: int, source: str, ref=None, once=False):
+    """Add amount XP to a user; returns (old_xp, new_xp), or None if the user is
+    gone. With once=True the source is recorded in the user's xp_awards and
+    never awarded to that user again (None if it already was)."""
+    user_id = ObjectId(user_id)
+    query, update = {"_id": user_id}, {"$inc": {"xp": amount}}
+    if once:
+        query["xp_awards"] = {"$ne": source}
+        update["$addToSet"] = {"xp_awards": source}
+    user = await users_collection.find_one_and_update(
+        query,
+        update,
+        projection={"xp": 1, "username": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if user is None:
+        return None
+
+    entry = {"user_id": user_id, "source": source, "amount": amount, "ts": datetime.utcnow()}
+    if ref is not None:
+        entry["ref"] = ref
+    xp_ledger_writer.add_documents([entry])
+
+    new_xp = user["xp"]
+    await invalidate_shared(str(user_id), new_xp)
+    publish_xp(str(user_id), user.get("username"), new_xp - amount, new_xp)
+    return new_xp - amount, new_xp
+
+
+# Needs the unique (user_id, period, period_start) index created at startup.
+_MERGE_INTO_TOTALS = {"$merge": {
+    "into": "xp_totals",
+    "on": ["user_id", "period", "period_start"],
+    "whenMatched": "replace",
+    "whenNotMatched": "insert",
+}}
+
+
+async def rollup(now: datetime = None):
+    """Recompute the current day/week/season totals; idempotent."""
+    now = now or datetime.utcnow()
+    today = period_start("day", now)
+
+    # Yesterday too, for ledger entries flushed after midnight.
+    await xp_ledger_collection.aggregate([
+        {"$match": {"ts": {"$gte": today - timedelta(days=1)}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": {"$dateFromParts": {
+                "year": {"$year": "$ts"}, "month": {"$month": "$ts"}, "day": {"$dayOfMonth": "$ts"},
+            }}},
+            "xp": {"$sum": "$amount"},
+        }},
+        {"$project": {"_id": 0, "user_id": "$_id.user_id", "period": "day", "period_start": "$_id.day", "xp": 1}},
+        _MERGE_INTO_TOTALS,
+    ]).to_list(length=None)
+
+    for period in ("week", "season"):
+        start = period_start(period, now)
+        await xp_totals_collection.aggregate([
+            {"$match": {"period": "day", "period_start": {"$gte": start}}},
+            {"$group": {"_id": "$user_id", "xp": {"$sum": "$xp"}}},
+            {"$project": {"_id": 0, "user_id": "$_id", "period": period, "period_start": start, "xp": 1}},
+            _MERGE_INTO_TOTALS,
+        ]).to_list(length=None)
+
+
+async def period_leaderboard(period: str, limit: int, now: datetime = None) -> list:
+    """Top users by XP earned in the current day, week or season."""
+    totals = await xp_totals_collection.find(
+        {"period": period, "period_start": period_start(period, now or datetime.utcnow())},
+        {"_id": 0, "user_id": 1, "xp": 1},
+    ).sort("xp", -1).limit(limit).to_list(length=limit)
+
+    users = await users_collection.find(
+        {"_id": {"$in": [total["user_id"] for total in totals]}}, {"username": 1}
+    ).to_list(length=limit)
+    names = {user["_id"]: user["username"] for user in users}
+
+    return [
+        {"user_id": str(total["user_id"]), "name": names.get(total["user_id"], ""), "points": total["xp"], "rank": rank}
+        for rank, total in enumerate(totals, 1)
+    ]
+
+
+class XPRollup:
+    """Runs rollup() every XP_ROLLUP_INTERVAL seconds in the background."""
+
+    def __init__(self, interval=XP_ROLLUP_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Flush first so the rollup sees everything awarded so far.
+            await xp_ledger_writer.flush()
+            try:
+                await rollup()
+            except Exception as e:
+                logger.error(f"XP rollup failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+xp_rollup = XPRollup()